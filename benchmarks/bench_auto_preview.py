@@ -0,0 +1,97 @@
+"""Бенчмарк подсветки изменений в автопредпросмотре (RedShapeEditor.display_auto_preview).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_auto_preview.py [--runs 20] [--baseline]
+
+Изображение 4K (3840x2160), около миллиона замененных пикселей. Показывается
+медианное время построения подсветки и отрисовки (без кэша и из кэша).
+--baseline дополнительно замеряет прежний попиксельный цикл Python.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import cv2
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from ui.main_window import RedShapeEditor
+
+TARGET_MS = 50
+
+
+def make_images(width=3840, height=2160, changed_side=1000):
+    """Исходное изображение и предпросмотр с заменой квадрата changed_side x changed_side"""
+    original = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.putText(original, "benchmark", (100, 400), cv2.FONT_HERSHEY_SIMPLEX, 10, (40, 40, 40), 20)
+    original[500:500 + changed_side, 1000:1000 + changed_side] = (27, 19, 236)
+
+    preview = original.copy()
+    preview[500:500 + changed_side, 1000:1000 + changed_side] = (255, 0, 0)
+    return original, preview
+
+
+def baseline_highlight(original, preview):
+    """Прежняя реализация: попиксельное смешивание в цикле Python"""
+    diff = cv2.absdiff(original, preview)
+    change_mask = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY) > 10
+    highlighted_img = preview.copy()
+    changed_coords = np.where(change_mask)
+    for i in range(len(changed_coords[0])):
+        y, x = changed_coords[0][i], changed_coords[1][i]
+        highlighted_img[y, x, 0] = int(highlighted_img[y, x, 0] * 0.7)
+        highlighted_img[y, x, 1] = int(highlighted_img[y, x, 1] * 0.7 + 255 * 0.3)
+        highlighted_img[y, x, 2] = int(highlighted_img[y, x, 2] * 0.7)
+    return highlighted_img
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--baseline", action="store_true", help="замерить прежний цикл Python")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    editor = RedShapeEditor()
+    editor.resize(1400, 900)
+
+    original, preview = make_images()
+    editor.image_processor.current_image = original
+    changed = int(np.count_nonzero(cv2.cvtColor(cv2.absdiff(original, preview), cv2.COLOR_BGR2GRAY) > 10))
+
+    def cold():
+        editor.auto_preview_cache = None
+        editor.display_auto_preview(preview)
+
+    cold_ms = measure(cold, args.runs)
+    warm_ms = measure(lambda: editor.display_auto_preview(preview), args.runs)
+
+    print(f"Изображение: {original.shape[1]}x{original.shape[0]}, изменено пикселей: {changed}")
+    print(f"display_auto_preview (без кэша): {cold_ms:.1f} мс (цель < {TARGET_MS} мс)")
+    print(f"display_auto_preview (из кэша):  {warm_ms:.2f} мс")
+
+    if args.baseline:
+        baseline_ms = measure(lambda: baseline_highlight(original, preview), 1)
+        print(f"Прежний цикл подсветки (только смешивание): {baseline_ms:.0f} мс")
+
+    editor.close()
+    app.quit()
+    return 0 if cold_ms < TARGET_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Генератор синтетических DOCX для бенчмарков.
+
+Запуск из корня репозитория:
+    python benchmarks/docx_generator.py out.docx --images 50 --size 1920x1080 --format jpg
+
+Документ собирается напрямую (zip + минимальный WordprocessingML), без
+python-docx: изображения идут отдельными абзацами в порядке следования.
+Доля изображений с целевым цветом (--target-images) и доля площади,
+закрашенной целевым цветом на таких изображениях (--target-area),
+задаются параметрами.
+"""
+import os
+import sys
+import argparse
+import zipfile
+
+import cv2
+import numpy as np
+
+# Целевой цвет по умолчанию (RGB), как в DocumentProcessor
+TARGET_COLOR = (236, 19, 27)
+
+# Цвета "обычного" содержимого (RGB): не попадают под целевой цвет
+NEUTRAL_COLORS = [(40, 40, 40), (30, 90, 200), (60, 160, 80), (120, 120, 120), (250, 200, 40)]
+
+EMU_PER_PIXEL = 9525
+MAX_WIDTH_EMU = 5900000
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+}
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+)
+
+IMAGE_RELTYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+
+def make_image(width: int, height: int, target_area: float, rng: np.random.Generator) -> np.ndarray:
+    """Изображение (BGR) с фоном, нейтральными фигурами и долей target_area целевого цвета"""
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    # Слабый шум, чтобы сжатие было похоже на реальные картинки
+    noise = rng.integers(0, 12, size=(height, width, 1), dtype=np.uint8)
+    img -= noise
+
+    for _ in range(12):
+        color = NEUTRAL_COLORS[rng.integers(len(NEUTRAL_COLORS))][::-1]
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(max(2, min(width, height) // 40), max(3, min(width, height) // 8)))
+        cv2.circle(img, (x, y), radius, color, -1)
+    cv2.putText(img, "benchmark", (width // 20, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                max(1.0, width / 600), (40, 40, 40), max(1, width // 400))
+
+    # Целевой цвет - горизонтальные полосы нужной суммарной площади
+    if target_area > 0:
+        target_rows = max(1, int(height * target_area))
+        stripes = 4
+        stripe_height = max(1, target_rows // stripes)
+        for i in range(stripes):
+            top = (i * height) // stripes + height // (stripes * 4)
+            img[top:top + stripe_height, :] = TARGET_COLOR[::-1]
+
+    return img
+
+
+def drawing_xml(rel_id: str, index: int, width: int, height: int) -> str:
+    """Абзац с рисунком в тексте, ссылающимся на rel_id"""
+    scale = min(1.0, MAX_WIDTH_EMU / (width * EMU_PER_PIXEL))
+    cx, cy = int(width * EMU_PER_PIXEL * scale), int(height * EMU_PER_PIXEL * scale)
+    return (
+        f'<w:p><w:r><w:drawing><wp:inline>'
+        f'<wp:extent cx="{cx}" cy="{cy}"/>'
+        f'<wp:docPr id="{index}" name="Picture {index}"/>'
+        f'<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{index}" name="image{index}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+        f'</pic:pic></a:graphicData></a:graphic>'
+        f'</wp:inline></w:drawing></w:r></w:p>'
+    )
+
+
+def generate_docx(path: str, images: int = 20, width: int = 1920, height: int = 1080,
+                  image_format: str = 'png', target_images: float = 0.5,
+                  target_area: float = 0.05, seed: int = 0) -> str:
+    """Создание DOCX с images изображениями; возвращает путь"""
+    if image_format not in CONTENT_TYPES:
+        raise ValueError(f"Неподдерживаемый формат: {image_format}")
+
+    rng = np.random.default_rng(seed)
+    target_count = int(round(images * target_images))
+    # Изображения с целевым цветом распределены по документу равномерно
+    target_indices = set(np.linspace(0, images - 1, target_count).astype(int).tolist()) if target_count else set()
+
+    body = []
+    relationships = []
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(images):
+            img = make_image(width, height, target_area if i in target_indices else 0.0, rng)
+            ext = '.jpg' if image_format == 'jpg' else '.png'
+            params = [cv2.IMWRITE_JPEG_QUALITY, 90] if image_format == 'jpg' else []
+            data = cv2.imencode(ext, img, params)[1].tobytes()
+
+            rel_id = f"rId{i + 100}"
+            media_name = f"media/image{i + 1}.{image_format}"
+            # Сжатые форматы хранятся без повторного сжатия, как это делает Word
+            archive.writestr(f"word/{media_name}", data, compress_type=zipfile.ZIP_STORED)
+            relationships.append(f'<Relationship Id="{rel_id}" Type="{IMAGE_RELTYPE}" Target="{media_name}"/>')
+            body.append(f'<w:p><w:r><w:t>Рисунок {i + 1}</w:t></w:r></w:p>')
+            body.append(drawing_xml(rel_id, i + 1, width, height))
+
+        archive.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Default Extension="{image_format}" ContentType="{CONTENT_TYPES[image_format]}"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'))
+        archive.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/>'
+            '</Relationships>'))
+        archive.writestr('word/_rels/document.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(relationships) + '</Relationships>'))
+        archive.writestr('word/document.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<w:document {NAMESPACES}><w:body>' + ''.join(body) + '</w:body></w:document>'))
+
+    return path
+
+
+def parse_size(value: str):
+    """Разбор размера вида 1920x1080"""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверный размер: {value} (ожидается ШИРИНАxВЫСОТА)")
+    return width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор синтетических DOCX для бенчмарков")
+    parser.add_argument("output", help="Путь к создаваемому DOCX")
+    parser.add_argument("--images", type=int, default=20, help="Число изображений")
+    parser.add_argument("--size", type=parse_size, default=(1920, 1080), metavar="WxH", help="Размер изображений")
+    parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default="png", help="Формат изображений")
+    parser.add_argument("--target-images", type=float, default=0.5,
+                        help="Доля изображений с целевым цветом (0..1)")
+    parser.add_argument("--target-area", type=float, default=0.05,
+                        help="Доля площади целевого цвета на таких изображениях (0..1)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generate_docx(args.output, args.images, args.size[0], args.size[1], args.format,
+                  args.target_images, args.target_area, args.seed)
+    print(f"Создан документ: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""Набор бенчмарков основных этапов обработки на синтетическом DOCX.
+
+Запуск из корня репозитория:
+    python benchmarks/run_benchmarks.py [--images 20] [--size 1920x1080] [--format png]
+                                        [--output results.json] [--baseline old.json]
+
+Замеряются load_document, filter_images_with_red (без кэша обнаружения и с
+прогретым временным кэшем), добавление 1/10/100 регионов с построением
+результата (process_image_with_regions), добавление одного региона к уже
+построенным, display_auto_preview под offscreen Qt (на изображении документа
+и на 4K-сценарии из bench_auto_preview) и save_processed_document вместе с
+кодированием замененных изображений.
+
+Перед замерами обработки проверяется, что обработка полосами
+(process_image_tiled) дает тот же результат, что и process_image_with_regions,
+для регионов всех видов, а кэш обнаружения с маленьким лимитом, заполняемый
+несколькими экземплярами подряд, не вырастает сверх лимита; расхождение -
+ошибка (код возврата 1).
+
+Результаты (медиана и минимум в мс) пишутся в JSON вместе с коммитом и
+параметрами запуска. С --baseline результаты сравниваются с прежним файлом;
+замедление больше --threshold считается регрессией (код возврата 1).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import cv2
+import numpy as np
+
+from core.document_processor import DocumentProcessor
+from core.image_processor import ImageProcessor, TILE_BYTES_PER_PIXEL
+from core.detection_cache import DetectionCache
+from docx_generator import generate_docx, parse_size
+
+REGION_COUNTS = (1, 10, 100)
+DEFAULT_THRESHOLD = 1.2
+
+
+def measure(func, repeat, setup=None, teardown=None):
+    """Время вызова func (мс) за repeat запусков; setup и teardown не замеряются"""
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state)
+        timings.append((time.perf_counter() - start) * 1000)
+        if teardown:
+            teardown(state)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'runs': repeat,
+    }
+
+
+def make_regions(count, width, height, seed=0):
+    """count прямоугольников и эллипсов, равномерно разбросанных по изображению"""
+    rng = np.random.default_rng(seed)
+    regions = []
+    for i in range(count):
+        x1, y1 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x2 = min(width - 1, x1 + int(rng.integers(width // 40 + 1, width // 6 + 2)))
+        y2 = min(height - 1, y1 + int(rng.integers(height // 40 + 1, height // 6 + 2)))
+        regions.append({'type': 'rectangle' if i % 2 == 0 else 'ellipse',
+                        'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
+    return regions
+
+
+def make_check_regions(width, height, seed=0):
+    """Регионы и маски всех видов (часть выходит за границы изображения)"""
+    rng = np.random.default_rng(seed)
+
+    def point():
+        return [int(rng.integers(-width // 10, width + width // 10)),
+                int(rng.integers(-height // 10, height + height // 10))]
+
+    regions = []
+    for region_type in ('rectangle', 'ellipse') * 3:
+        (x1, y1), (x2, y2) = point(), point()
+        regions.append({'type': region_type, 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
+    regions += [{'type': 'lasso', 'points': [point() for _ in range(8)]} for _ in range(3)]
+    mask_regions = [{'type': 'mask', 'tool': tool, 'points': [point() for _ in range(6)]}
+                    for tool in ('draw', 'erase', 'draw')]
+    return regions, mask_regions
+
+
+def check_tiled(document_processor, image_idx, stripe_rows=(1, 7, 64)):
+    """Сравнение process_image_tiled с process_image_with_regions; возвращает список расхождений"""
+    image = document_processor.get_image(image_idx)
+    height, width = image.shape[:2]
+    mismatches = []
+    for seed in range(5):
+        regions, mask_regions = make_check_regions(width, height, seed)
+        image_processor = ImageProcessor(document_processor)
+        image_processor.load_image(image_idx)
+        for region in regions:
+            image_processor.add_region(region)
+        for mask_region in mask_regions:
+            image_processor.add_mask_region(mask_region)
+        expected, expected_count = image_processor.process_image_with_regions()
+
+        for rows in stripe_rows:
+            # Отдельные копии регионов: растеризация не берется из кэша обычной обработки
+            tiled = ImageProcessor(document_processor)
+            tiled.regions = [dict(region, raster=None) for region in regions]
+            tiled.mask_regions = [dict(mask_region, raster=None) for mask_region in mask_regions]
+            result, count = tiled.process_image_tiled(image.copy(), rows * width * TILE_BYTES_PER_PIXEL)
+            if count != expected_count or not np.array_equal(result, expected):
+                mismatches.append(f"seed={seed} stripe_rows={rows}: {count} vs {expected_count} пикселей, "
+                                  f"отличается {int(np.count_nonzero(np.any(result != expected, axis=2)))}")
+    return mismatches
+
+
+def check_detection_cache(work_dir, instances=6, puts=40, max_bytes=8 * 1024):
+    """Вытеснение в кэше обнаружения, который открывается заново для каждого документа"""
+    cache_path = os.path.join(work_dir, 'eviction_cache.sqlite')
+    settings = json.dumps([0, 'check'])
+    problems = []
+    evicted = 0
+    for instance in range(instances):
+        cache = DetectionCache(cache_path, max_bytes)
+        for i in range(puts):
+            cache.put(f"{instance:04d}{i:036d}", settings, True, [i, i * 7, i * 13])
+        evicted += cache.get_stats()['evicted']
+        cache.close()
+
+        cache = DetectionCache(cache_path, max_bytes)
+        total = cache.connection.execute('SELECT COALESCE(SUM(size), 0) FROM detections').fetchone()[0]
+        cache.close()
+        if total > max_bytes:
+            problems.append(f"экземпляр {instance + 1}: размер кэша {total} > лимита {max_bytes}")
+    if not evicted:
+        problems.append("записи не вытеснялись")
+    return problems
+
+
+def whole_image_region(img):
+    height, width = img.shape[:2]
+    return {'type': 'rectangle', 'x1': 0, 'y1': 0, 'x2': width - 1, 'y2': height - 1}
+
+
+def open_document(docx_path, use_cache=False, cache_path=None):
+    """Загруженный DocumentProcessor (кэш обнаружения по умолчанию выключен)"""
+    document_processor = DocumentProcessor()
+    document_processor.use_detection_cache = use_cache
+    document_processor.detection_cache_path = cache_path
+    document_processor.load_document(docx_path)
+    return document_processor
+
+
+def bench_document(docx_path, repeat, work_dir):
+    """Этапы загрузки, сканирования, построения результата и сохранения"""
+    results = {}
+
+    def new_processor(_=None):
+        return DocumentProcessor()
+
+    results['load_document'] = measure(
+        lambda dp: dp.load_document(docx_path), repeat,
+        setup=new_processor, teardown=lambda dp: dp.cleanup())
+
+    def scan(dp):
+        dp.filter_images_with_red(ImageProcessor(dp))
+
+    results['filter_images_with_red'] = measure(
+        scan, repeat, setup=lambda: open_document(docx_path), teardown=lambda dp: dp.cleanup())
+
+    # Кэш во временной папке: прогревается одним запуском, пользовательский не затрагивается
+    cache_path = os.path.join(work_dir, 'detection_cache.sqlite')
+    warm = open_document(docx_path, use_cache=True, cache_path=cache_path)
+    scan(warm)
+    filtered_indices = list(warm.filtered_indices)
+    warm.cleanup()
+    results['filter_images_with_red_cached'] = measure(
+        scan, repeat, setup=lambda: open_document(docx_path, True, cache_path),
+        teardown=lambda dp: dp.cleanup())
+
+    if not filtered_indices:
+        print("В документе нет изображений с целевыми цветами - этапы обработки пропущены")
+        return results, None, []
+
+    document_processor = open_document(docx_path)
+    image_idx = filtered_indices[0]
+    image = document_processor.get_image(image_idx)
+    height, width = image.shape[:2]
+
+    mismatches = check_tiled(document_processor, image_idx)
+
+    def tiled_whole_image(_):
+        tiled = ImageProcessor(document_processor)
+        tiled.add_region(whole_image_region(image))
+        tiled.process_image_tiled(image.copy())
+
+    results['process_image_tiled'] = measure(tiled_whole_image, repeat)
+
+    for count in REGION_COUNTS:
+        regions = make_regions(count, width, height, seed=count)
+
+        def loaded_processor():
+            image_processor = ImageProcessor(document_processor)
+            image_processor.load_image(image_idx)
+            return image_processor
+
+        def add_and_process(image_processor):
+            for region in regions:
+                image_processor.add_region(region)
+            image_processor.process_image_with_regions()
+
+        results[f'process_image_with_regions_{count}'] = measure(
+            add_and_process, repeat, setup=loaded_processor)
+
+        def prepared_processor():
+            image_processor = loaded_processor()
+            add_and_process(image_processor)
+            return image_processor
+
+        extra_region = make_regions(1, width, height, seed=1000 + count)[0]
+
+        def add_one(image_processor):
+            image_processor.add_region(dict(extra_region))
+            image_processor.process_image_with_regions()
+
+        results[f'add_region_after_{count}'] = measure(add_one, repeat, setup=prepared_processor)
+
+    image_processor = ImageProcessor(document_processor)
+    image_processor.load_image(image_idx)
+    image_processor.add_region(whole_image_region(image))
+    preview, _ = image_processor.process_image_with_regions()
+    document_processor.cleanup()
+
+    def processed_document():
+        dp = open_document(docx_path)
+        dp.filtered_indices = list(filtered_indices)
+        processor = ImageProcessor(dp)
+        processed = []
+        for idx in filtered_indices:
+            processor.load_image(idx)
+            processor.clear_regions()
+            processor.add_region(whole_image_region(processor.current_image))
+            processed.append((idx, processor.process_image_with_regions()[0], processor.get_change_mask()))
+        return dp, processed
+
+    def encode_and_save(state):
+        dp, processed = state
+        for idx, img, change_mask in processed:
+            dp.update_image_in_document(idx, img, change_mask)
+        dp.save_processed_document(os.path.join(work_dir, 'processed.docx'))
+
+    results['save_processed_document'] = measure(
+        encode_and_save, repeat, setup=processed_document, teardown=lambda state: state[0].cleanup())
+
+    return results, (image, preview), mismatches
+
+
+def bench_auto_preview(repeat, document_images):
+    """display_auto_preview под offscreen Qt"""
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from ui.main_window import RedShapeEditor
+        from bench_auto_preview import make_images
+    except ImportError as e:
+        print(f"PyQt5 недоступен, display_auto_preview пропущен: {e}")
+        return {}
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    editor = RedShapeEditor()
+    editor.resize(1400, 900)
+
+    scenarios = {'display_auto_preview_4k': make_images()}
+    if document_images is not None:
+        scenarios['display_auto_preview'] = document_images
+
+    results = {}
+    for name, (original, preview) in scenarios.items():
+        editor.image_processor.current_image = original
+
+        def cold(_):
+            editor.auto_preview_cache = None
+            editor.display_auto_preview(preview)
+
+        results[name] = measure(cold, repeat)
+
+    editor.close()
+    app.processEvents()
+    return results
+
+
+def get_commit():
+    """Текущий коммит репозитория (если доступен git)"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Сравнение с прежними результатами; возвращает список регрессий"""
+    if baseline.get('config') != results['config']:
+        print("Внимание: параметры запуска отличаются от базовых, сравнение может быть некорректным")
+
+    regressions = []
+    print(f"\nСравнение с {baseline.get('commit') or 'базовой линией'} (медиана, мс):")
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None:
+            print(f"  {name:36s} {current['median_ms']:10.2f}   (нет в базовой линии)")
+            continue
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else float('inf')
+        mark = ''
+        if ratio > threshold:
+            mark = '  РЕГРЕССИЯ'
+            regressions.append(name)
+        print(f"  {name:36s} {previous['median_ms']:10.2f} -> {current['median_ms']:10.2f}  x{ratio:.2f}{mark}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки этапов обработки DOCX")
+    parser.add_argument("--docx", help="Готовый документ вместо синтетического")
+    parser.add_argument("--images", type=int, default=20, help="Число изображений синтетического документа")
+    parser.add_argument("--size", type=parse_size, default=(1920, 1080), metavar="WxH", help="Размер изображений")
+    parser.add_argument("--format", choices=['png', 'jpg'], default="png", help="Формат изображений")
+    parser.add_argument("--target-images", type=float, default=0.5, help="Доля изображений с целевым цветом")
+    parser.add_argument("--target-area", type=float, default=0.05, help="Доля площади целевого цвета")
+    parser.add_argument("--repeat", type=int, default=5, help="Число повторов каждого замера")
+    parser.add_argument("--no-gui", action="store_true", help="Не замерять display_auto_preview")
+    parser.add_argument("--output", default="benchmark_results.json", help="Файл результатов (JSON)")
+    parser.add_argument("--baseline", help="Файл прежних результатов для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое замедление относительно базовой линии (во сколько раз)")
+    args = parser.parse_args(argv)
+
+    config = {
+        'docx': os.path.basename(args.docx) if args.docx else None,
+        'images': args.images, 'size': list(args.size), 'format': args.format,
+        'target_images': args.target_images, 'target_area': args.target_area,
+        'repeat': args.repeat,
+    }
+
+    work_dir = tempfile.mkdtemp(prefix='color_redact_bench_')
+    try:
+        docx_path = args.docx
+        if docx_path is None:
+            docx_path = os.path.join(work_dir, 'synthetic.docx')
+            start = time.perf_counter()
+            generate_docx(docx_path, args.images, args.size[0], args.size[1], args.format,
+                          args.target_images, args.target_area)
+            print(f"Синтетический документ: {args.images} изображений {args.size[0]}x{args.size[1]} "
+                  f"{args.format} ({time.perf_counter() - start:.1f} с)")
+
+        benchmarks, document_images, mismatches = bench_document(docx_path, args.repeat, work_dir)
+        cache_problems = check_detection_cache(work_dir)
+        if not args.no_gui:
+            benchmarks.update(bench_auto_preview(args.repeat, document_images))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'commit': get_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+        },
+        'config': config,
+        'benchmarks': benchmarks,
+    }
+
+    print("\nРезультаты (медиана / минимум, мс):")
+    for name, result in benchmarks.items():
+        print(f"  {name:36s} {result['median_ms']:10.2f} / {result['min_ms']:.2f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены: {args.output}")
+
+    if mismatches:
+        print("Обработка полосами расходится с process_image_with_regions:")
+        for mismatch in mismatches:
+            print(f"  {mismatch}")
+        return 1
+
+    if cache_problems:
+        print("Кэш обнаружения превышает лимит размера:")
+        for problem in cache_problems:
+            print(f"  {problem}")
+        return 1
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессии (> x{args.threshold}): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
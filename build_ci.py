@@ -21,12 +21,6 @@ def main():
         '--add-data=core;core',
         '--add-data=ui;ui',
         '--add-data=utils;utils',
-        '--hidden-import=docx.oxml',
-        '--hidden-import=docx.opc.constants',
-        '--hidden-import=docx.image',
-        '--hidden-import=docx.oxml.shape',
-        '--hidden-import=docx.oxml.ns',
-        '--hidden-import=docx.opc.phys_pkg',
         '--hidden-import=PIL._imaging',
         '--hidden-import=cv2',
         '--hidden-import=lxml.etree',
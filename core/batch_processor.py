@@ -0,0 +1,242 @@
+import os
+import glob
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+from core.document_processor import DocumentProcessor
+from core.image_processor import ImageProcessor
+from core import tracing
+
+
+# Режимы пакетной обработки
+MODE_WHOLE_IMAGE = 'whole'
+MODE_REGIONS = 'regions'
+
+
+def load_regions_file(regions_path: str) -> Dict[str, List[Dict]]:
+    """Загрузка сохраненных регионов из JSON.
+
+    Формат: {"regions": [...], "mask_regions": [...]} либо просто список
+    регионов. Координаты задаются в пикселях изображения, как в ImageProcessor.
+    """
+    with open(regions_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        data = {'regions': data}
+
+    return {
+        'regions': list(data.get('regions', [])),
+        'mask_regions': list(data.get('mask_regions', []))
+    }
+
+
+def find_docx_files(input_dir: str) -> List[str]:
+    """Поиск DOCX файлов в папке (рекурсивно), без результатов прошлых запусков"""
+    docx_files = []
+    for path in sorted(glob.glob(os.path.join(input_dir, '**', '*.docx'), recursive=True)):
+        name = os.path.basename(path)
+        # Пропускаем временные файлы Word и уже обработанные документы
+        if name.startswith('~$') or name.endswith('_processed.docx'):
+            continue
+        docx_files.append(path)
+    return docx_files
+
+
+def get_output_path(docx_path: str, input_dir: str, output_dir: Optional[str]) -> Optional[str]:
+    """Путь для обработанного документа (None - рядом с исходным)"""
+    if not output_dir:
+        return None
+
+    relative = os.path.relpath(docx_path, input_dir)
+    base_name = os.path.splitext(relative)[0]
+    output_path = os.path.join(output_dir, f"{base_name}_processed.docx")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return output_path
+
+
+def process_document(docx_path: str, settings: Dict[str, Any], mode: str,
+                     regions: Optional[Dict[str, List[Dict]]] = None,
+                     output_path: Optional[str] = None) -> Dict[str, Any]:
+    """Обработка одного документа без интерфейса.
+
+    Выполняется в отдельном процессе, поэтому все аргументы - простые данные.
+    Возвращает сводку по документу (время этапов, число замененных пикселей).
+    При settings['trace'] в сводку добавляются события трассировки процесса
+    (trace_events) - основной процесс объединяет их в общую трассу.
+    """
+    if not settings.get('trace'):
+        return _process_document(docx_path, settings, mode, regions, output_path)
+
+    tracing.get_tracer().enable()
+    with tracing.span('document', path=os.path.basename(docx_path)) as stage:
+        summary = _process_document(docx_path, settings, mode, regions, output_path)
+        stage.set(status=summary['status'], images=summary['images_total'],
+                  touched=len(summary['images_touched']), pixels_replaced=summary['pixels_replaced'])
+    summary['trace_events'] = tracing.get_tracer().drain()
+    return summary
+
+
+def _process_document(docx_path: str, settings: Dict[str, Any], mode: str,
+                      regions: Optional[Dict[str, List[Dict]]],
+                      output_path: Optional[str]) -> Dict[str, Any]:
+    summary = {
+        'path': docx_path,
+        'output': None,
+        'status': 'ok',
+        'error': None,
+        'images_total': 0,
+        'images_matched': 0,
+        'images_touched': [],
+        'pixels_replaced': 0,
+        'timings': {}
+    }
+    timings = summary['timings']
+    started = time.perf_counter()
+
+    document_processor = DocumentProcessor()
+    try:
+        document_processor.target_colors = [tuple(color) for color in settings['target_colors']]
+        document_processor.set_replacement_color(tuple(settings['replacement_color']))
+        document_processor.set_color_tolerance(settings['color_tolerance'])
+        document_processor.set_saturation_threshold(settings['saturation_threshold'])
+        document_processor.set_value_threshold(settings['value_threshold'])
+        # Документы уже обрабатываются параллельно, внутри процесса сканируем в один поток
+        document_processor.scan_workers = 1
+        document_processor.use_detection_cache = settings.get('use_detection_cache', True)
+        if settings.get('debug_dir'):
+            document_name = os.path.splitext(os.path.basename(docx_path))[0]
+            document_processor.debug_dir = os.path.join(settings['debug_dir'], document_name)
+
+        image_processor = ImageProcessor(document_processor)
+
+        stage_start = time.perf_counter()
+        loaded = document_processor.load_document(docx_path)
+        timings['load'] = time.perf_counter() - stage_start
+        if not loaded:
+            summary['status'] = 'no_images'
+            return summary
+
+        summary['images_total'] = len(document_processor.image_parts)
+        summary['images_by_part'] = document_processor.get_part_counts()
+
+        stage_start = time.perf_counter()
+        document_processor.filter_images_with_red(image_processor)
+        timings['scan'] = time.perf_counter() - stage_start
+        summary['images_matched'] = len(document_processor.filtered_indices)
+
+        stage_start = time.perf_counter()
+        for index, image_idx in enumerate(document_processor.filtered_indices):
+            # Изображение декодируется в обход кэша и обрабатывается полосами на месте
+            img = document_processor.decode_image(image_idx)
+            if img is None:
+                continue
+
+            image_processor.clear_regions()
+            if mode == MODE_WHOLE_IMAGE:
+                height, width = img.shape[:2]
+                image_processor.add_region({
+                    'type': 'rectangle',
+                    'x1': 0, 'y1': 0,
+                    'x2': width - 1, 'y2': height - 1
+                })
+            else:
+                for region in regions['regions']:
+                    image_processor.add_region(region)
+                for mask_region in regions['mask_regions']:
+                    image_processor.add_mask_region(mask_region)
+
+            processed_img, replaced_count = image_processor.process_image_tiled(img)
+            if replaced_count == 0:
+                continue
+
+            # Кодирование в исходном формате идет в фоне, пока обрабатывается следующее
+            if document_processor.update_image_in_document(image_idx, processed_img):
+                summary['images_touched'].append(image_idx + 1)
+                summary['pixels_replaced'] += int(replaced_count)
+        timings['process'] = time.perf_counter() - stage_start
+
+        if summary['images_touched']:
+            stage_start = time.perf_counter()
+            summary['output'] = document_processor.save_processed_document(output_path)
+            timings['save'] = time.perf_counter() - stage_start
+        else:
+            summary['status'] = 'unchanged'
+
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = str(e)
+    finally:
+        if document_processor.detection_cache is not None:
+            summary['detection_cache'] = document_processor.detection_cache.get_stats()
+        document_processor.cleanup()
+        timings['total'] = time.perf_counter() - started
+
+    return summary
+
+
+def run_batch(input_dir: str, settings: Dict[str, Any], mode: str = MODE_WHOLE_IMAGE,
+              regions_path: Optional[str] = None, output_dir: Optional[str] = None,
+              summary_path: Optional[str] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Пакетная обработка всех DOCX в папке на нескольких ядрах"""
+    regions = load_regions_file(regions_path) if mode == MODE_REGIONS else None
+    docx_files = find_docx_files(input_dir)
+    workers = workers or os.cpu_count() or 1
+
+    started_at = datetime.now().isoformat(timespec='seconds')
+    started = time.perf_counter()
+    print(f"Найдено документов: {len(docx_files)} (процессов: {workers})")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_document, path, settings, mode, regions,
+                            get_output_path(path, input_dir, output_dir)): path
+            for path in docx_files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'path': path, 'status': 'error', 'error': str(e),
+                          'images_touched': [], 'pixels_replaced': 0, 'timings': {}}
+            tracing.get_tracer().add_events(result.pop('trace_events', []))
+            results[path] = result
+
+            mark = {'ok': '✓', 'unchanged': '○', 'no_images': '○'}.get(result['status'], '❌')
+            print(f"{mark} {path}: изображений изменено {len(result['images_touched'])}, "
+                  f"пикселей заменено {result['pixels_replaced']}")
+
+    files = [results[path] for path in docx_files]
+    summary = {
+        'started': started_at,
+        'input_dir': input_dir,
+        'output_dir': output_dir,
+        'mode': mode,
+        'regions_file': regions_path,
+        'settings': settings,
+        'workers': workers,
+        'files': files,
+        'totals': {
+            'documents': len(files),
+            'documents_changed': sum(1 for f in files if f['status'] == 'ok'),
+            'documents_failed': sum(1 for f in files if f['status'] == 'error'),
+            'images_touched': sum(len(f['images_touched']) for f in files),
+            'pixels_replaced': sum(f['pixels_replaced'] for f in files),
+            'detection_cache_hits': sum(f.get('detection_cache', {}).get('hits', 0) for f in files),
+            'detection_cache_misses': sum(f.get('detection_cache', {}).get('misses', 0) for f in files),
+            'detection_cache_evicted': sum(f.get('detection_cache', {}).get('evicted', 0) for f in files),
+            'elapsed': time.perf_counter() - started
+        }
+    }
+
+    if summary_path:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"Сводка сохранена: {summary_path}")
+
+    return summary
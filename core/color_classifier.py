@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+from typing import List, Tuple, Sequence
+
+from core import tracing
+
+
+# Число целевых цветов в одной карте меток: каждому цвету соответствует бит в метке
+# пикселя; при большем числе цветов карт несколько (по группам цветов)
+MAX_TARGET_COLORS = 31
+
+# Быстрая проверка наличия цвета: размер грубой выборки и полос полного прохода (в пикселях)
+COARSE_PROBE_PIXELS = 64 * 1024
+PROBE_TILE_PIXELS = 1024 * 1024
+
+
+class ColorClassifier:
+    """Классификация пикселей сразу по всем целевым цветам.
+
+    Таблица строится один раз для набора настроек: для каждого значения тона
+    (H) хранится битовая маска подходящих целевых цветов. Пороги насыщенности
+    и яркости у всех цветов общие, поэтому изображение переводится в HSV один
+    раз, а метка пикселя получается одним табличным преобразованием канала H.
+    Цветов больше MAX_TARGET_COLORS делятся на группы, у каждой группы своя
+    таблица и карта меток.
+    """
+
+    def __init__(self, target_colors: Sequence[Tuple[int, int, int]], tolerance: int,
+                 saturation_threshold: int, value_threshold: int):
+        self.target_colors = [tuple(color) for color in target_colors]
+        self.tolerance = tolerance
+        self.saturation_threshold = saturation_threshold
+        self.value_threshold = value_threshold
+
+        groups = [self.target_colors[start:start + MAX_TARGET_COLORS]
+                  for start in range(0, len(self.target_colors), MAX_TARGET_COLORS)] or [[]]
+        self.group_sizes = [len(group) for group in groups]
+
+        if self.group_sizes[0] <= 8:
+            self.label_dtype = np.uint8
+        elif self.group_sizes[0] <= 16:
+            self.label_dtype = np.uint16
+        else:
+            self.label_dtype = np.int32
+
+        self.hue_tables = [self._build_hue_table(group) for group in groups]
+        self.sv_lower = (0, saturation_threshold, value_threshold)
+        self.sv_upper = (255, 255, 255)
+
+    @staticmethod
+    def make_key(target_colors, tolerance, saturation_threshold, value_threshold) -> tuple:
+        """Ключ настроек, при изменении которого таблицу нужно перестроить"""
+        return (tuple(tuple(color) for color in target_colors), tolerance,
+                saturation_threshold, value_threshold)
+
+    @property
+    def key(self) -> tuple:
+        return self.make_key(self.target_colors, self.tolerance,
+                             self.saturation_threshold, self.value_threshold)
+
+    def _build_hue_table(self, colors: Sequence[Tuple[int, int, int]]) -> np.ndarray:
+        """Построение таблицы тон -> битовая маска целевых цветов группы"""
+        table = np.zeros(256, dtype=self.label_dtype)
+
+        for bit, target_color in enumerate(colors):
+            # Целевой цвет хранится в RGB
+            target_rgb = np.uint8([[list(target_color)]])
+            target_hue = int(cv2.cvtColor(target_rgb, cv2.COLOR_RGB2HSV)[0][0][0])
+
+            lower = max(0, target_hue - self.tolerance)
+            upper = min(179, target_hue + self.tolerance)
+            if lower <= upper:
+                table[lower:upper + 1] |= self.label_dtype(1 << bit)
+
+        return table
+
+    def classify(self, img: np.ndarray) -> List[np.ndarray]:
+        """Карты меток по группам цветов: бит k установлен, если пиксель подходит под k-й цвет группы"""
+        if not self.target_colors:
+            return [np.zeros(img.shape[:2], dtype=self.label_dtype)]
+
+        with tracing.span('hsv', pixels=img.shape[0] * img.shape[1]):
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            sv_mask = cv2.inRange(hsv, self.sv_lower, self.sv_upper)
+            return self._label_maps(hsv, sv_mask)
+
+    def _label_maps(self, hsv: np.ndarray, sv_mask: np.ndarray) -> List[np.ndarray]:
+        """Карты меток групп по HSV и маске достаточной насыщенности и яркости"""
+        hue = cv2.extractChannel(hsv, 0)
+        label_maps = []
+        for hue_table in self.hue_tables:
+            labels = cv2.LUT(hue, hue_table)
+            label_maps.append(cv2.bitwise_and(labels, labels, mask=sv_mask))
+        return label_maps
+
+    def match_mask(self, img: np.ndarray) -> np.ndarray:
+        """Маска (0/255) пикселей любого из целевых цветов"""
+        mask = None
+        for labels in self.classify(img):
+            if labels.dtype != np.uint8:
+                labels = (labels != 0).astype(np.uint8)
+            group_mask = cv2.threshold(labels, 0, 255, cv2.THRESH_BINARY)[1]
+            mask = group_mask if mask is None else cv2.bitwise_or(mask, group_mask)
+        return mask
+
+    def count_pixels(self, img: np.ndarray) -> List[int]:
+        """Количество пикселей каждого целевого цвета"""
+        counts = []
+        for labels, group_size in zip(self.classify(img), self.group_sizes):
+            counts.extend(self.count_labels(labels, group_size))
+        return counts
+
+    @staticmethod
+    def count_labels(labels: np.ndarray, colors: int) -> List[int]:
+        """Количество пикселей каждого из colors цветов группы по карте меток"""
+        if labels.dtype == np.uint8:
+            # Гистограмма по комбинациям бит, затем сумма по каждому биту
+            hist = cv2.calcHist([labels], [0], None, [256], [0, 256]).ravel()
+            values = np.arange(256)
+            return [int(hist[(values >> bit) & 1 == 1].sum())
+                    for bit in range(colors)]
+
+        return [cv2.countNonZero(cv2.bitwise_and(labels, int(1 << bit)))
+                for bit in range(colors)]
+
+    def contains(self, img: np.ndarray, min_pixels: int = 1) -> bool:
+        """Быстрая проверка: есть ли на изображении хотя бы min_pixels пикселей целевых цветов.
+
+        Сначала проверяется разреженная выборка реальных пикселей (каждый
+        step-й по обеим осям): если в ней уже набралось min_pixels совпадений,
+        ответ точный и дальше изображение не читается. Иначе выполняется полный
+        проход полосами с выходом, как только порог достигнут. Одноканальные
+        (серые) изображения не имеют насыщенности и отсекаются сразу.
+        """
+        if not self.target_colors or img is None:
+            return False
+
+        if img.ndim == 2 or img.shape[2] == 1:
+            # У серых пикселей S = 0 и тон 0
+            if self.saturation_threshold > 0 or not any(hue_table[0] for hue_table in self.hue_tables):
+                return False
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+        height, width = img.shape[:2]
+
+        # Грубый проход по разреженной выборке
+        step = int(np.sqrt(height * width / COARSE_PROBE_PIXELS))
+        if step > 1:
+            sample = np.ascontiguousarray(img[::step, ::step])
+            if cv2.countNonZero(self.match_mask(sample)) >= min_pixels:
+                return True
+
+        # Полный проход полосами с ранним выходом
+        tile_rows = max(1, PROBE_TILE_PIXELS // max(1, width))
+        found = 0
+        for y in range(0, height, tile_rows):
+            hsv = cv2.cvtColor(img[y:y + tile_rows], cv2.COLOR_BGR2HSV)
+            sv_mask = cv2.inRange(hsv, self.sv_lower, self.sv_upper)
+            if cv2.countNonZero(sv_mask) == 0:
+                # В полосе нет достаточно насыщенных и ярких пикселей
+                continue
+
+            label_maps = self._label_maps(hsv, sv_mask)
+            labels = label_maps[0]
+            for group_labels in label_maps[1:]:
+                labels = cv2.bitwise_or(labels, group_labels)
+            found += cv2.countNonZero(labels)
+            if found >= min_pixels:
+                return True
+
+        return False
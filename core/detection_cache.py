@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional, Tuple, Dict, Any
+
+from core.color_classifier import ColorClassifier
+
+
+# Версия алгоритма обнаружения: при изменении старые записи не используются
+DETECTION_VERSION = 1
+
+# Ограничение размера кэша по умолчанию (байт, оценка по записям)
+DEFAULT_DETECTION_CACHE_BYTES = 64 * 1024 * 1024
+
+# Оценка служебного размера записи (ключ, индекс, страница SQLite)
+ROW_OVERHEAD = 160
+
+# Время последнего использования обновляется, только если оно старше этого (секунды):
+# для вытеснения давно не использованных записей точность до часа достаточна
+LAST_USED_REFRESH_INTERVAL = 60 * 60
+
+# Сколько отложенных обновлений времени использования записывать одной транзакцией
+TOUCH_BATCH_SIZE = 64
+
+CACHE_FILE_NAME = 'detection_cache.sqlite'
+
+
+def get_user_cache_dir() -> str:
+    """Папка кэша приложения в каталоге пользователя"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'color_redact')
+
+
+def content_hash(blob: bytes) -> str:
+    """Хэш содержимого изображения"""
+    return hashlib.sha1(blob).hexdigest()
+
+
+def settings_key(settings) -> str:
+    """Ключ настроек обнаружения (целевые цвета, допуск, пороги)"""
+    key = ColorClassifier.make_key(settings.target_colors, settings.color_tolerance,
+                                   settings.saturation_threshold, settings.value_threshold)
+    return json.dumps([DETECTION_VERSION, key], separators=(',', ':'))
+
+
+class DetectionCache:
+    """Постоянный кэш результатов поиска целевых цветов.
+
+    Записи хранятся в SQLite и адресуются хэшем содержимого изображения и
+    настройками обнаружения, поэтому одинаковые логотипы и штампы в разных
+    документах не декодируются повторно. Для изображения хранится признак
+    наличия целевых цветов и, если они посчитаны, число пикселей каждого
+    цвета. При превышении размера удаляются давно использованные записи.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_DETECTION_CACHE_BYTES):
+        if path is None:
+            path = os.path.join(get_user_cache_dir(), CACHE_FILE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Отложенные обновления last_used: (хэш, настройки) -> время
+        self._touched = {}
+        self._lock = threading.Lock()
+
+        # Кэш используется из потока сканирования и из пакетных процессов одновременно
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS detections (
+                content_hash TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                has_target INTEGER NOT NULL,
+                counts TEXT,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, settings)
+            )''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)')
+        self.connection.commit()
+
+        # Оценка размера кэша: считается при открытии и растет с каждой записью.
+        # Кэш открывается заново для каждого документа, поэтому лимит проверяется
+        # и здесь, а не только после множества записей одного экземпляра
+        with self._lock:
+            self._evict()
+
+    def get(self, blob_hash: str, settings: str) -> Optional[Tuple[bool, Optional[List[int]]]]:
+        """Сохраненный результат: (есть ли целевые цвета, пиксели по цветам или None)"""
+        row = self._lookup(blob_hash, settings)
+        if row is None:
+            return None
+        return bool(row[0]), json.loads(row[1]) if row[1] is not None else None
+
+    def get_counts(self, blob_hash: str, settings: str) -> Optional[List[int]]:
+        """Сохраненное число пикселей каждого целевого цвета"""
+        row = self._lookup(blob_hash, settings, need_counts=True)
+        if row is None:
+            return None
+        return json.loads(row[1])
+
+    def _lookup(self, blob_hash: str, settings: str, need_counts: bool = False):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT has_target, counts, last_used FROM detections WHERE content_hash = ? AND settings = ?',
+                (blob_hash, settings)).fetchone()
+            if row is None or (need_counts and row[1] is None):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            # Попадание не пишет в базу сразу: иначе параллельные пакетные процессы
+            # выстраиваются в очередь на блокировку записи WAL
+            now = time.time()
+            if now - row[2] > LAST_USED_REFRESH_INTERVAL:
+                self._touched[(blob_hash, settings)] = now
+                if len(self._touched) >= TOUCH_BATCH_SIZE:
+                    self._flush_touched()
+                    self.connection.commit()
+            return row
+
+    def _flush_touched(self):
+        """Запись отложенных обновлений времени использования (без commit)"""
+        if not self._touched:
+            return
+        self.connection.executemany(
+            'UPDATE detections SET last_used = ? WHERE content_hash = ? AND settings = ?',
+            [(used, blob_hash, settings) for (blob_hash, settings), used in self._touched.items()])
+        self._touched = {}
+
+    def put(self, blob_hash: str, settings: str, has_target: bool,
+            counts: Optional[List[int]] = None):
+        """Сохранение результата (известные пиксели по цветам не затираются)"""
+        counts_text = json.dumps([int(c) for c in counts]) if counts is not None else None
+        size = ROW_OVERHEAD + len(blob_hash) + len(settings) + len(counts_text or '')
+
+        with self._lock:
+            self.connection.execute('''
+                INSERT INTO detections (content_hash, settings, has_target, counts, size, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (content_hash, settings) DO UPDATE SET
+                    has_target = excluded.has_target,
+                    counts = COALESCE(excluded.counts, detections.counts),
+                    size = MAX(excluded.size, detections.size),
+                    last_used = excluded.last_used''',
+                (blob_hash, settings, int(has_target), counts_text, size, time.time()))
+            self._touched.pop((blob_hash, settings), None)
+            self._flush_touched()
+            self.connection.commit()
+
+            # Для обновленных записей оценка завышена; точный размер считает _evict
+            self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Удаление давно использованных записей сверх лимита размера"""
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM detections').fetchone()[0]
+        self._total = total
+        if total <= self.max_bytes:
+            return
+
+        # Освобождаем с запасом, чтобы не чистить кэш на каждой проверке
+        to_free = total - self.max_bytes * 3 // 4
+        freed = 0
+        stale = []
+        for blob_hash, settings, size in self.connection.execute(
+                'SELECT content_hash, settings, size FROM detections ORDER BY last_used'):
+            stale.append((blob_hash, settings))
+            freed += size
+            if freed >= to_free:
+                break
+
+        self.connection.executemany(
+            'DELETE FROM detections WHERE content_hash = ? AND settings = ?', stale)
+        self.connection.commit()
+        self._total = total - freed
+        self.evicted += len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий, промахов и удаленных при вытеснении записей"""
+        return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted}
+
+    def close(self):
+        with self._lock:
+            try:
+                self._flush_touched()
+                self.connection.commit()
+            except sqlite3.Error as e:
+                print(f"Кэш обнаружения: не удалось сохранить время использования: {e}")
+            self.connection.close()
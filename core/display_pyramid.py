@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+from typing import Tuple, Optional
+
+
+def fit_size(width: int, height: int, target_width: int, target_height: int) -> Tuple[int, int]:
+    """Размер изображения, вписанного в target с сохранением пропорций (как Qt.KeepAspectRatio)"""
+    target_width, target_height = max(1, target_width), max(1, target_height)
+    scaled_width = target_height * width // height
+    if scaled_width <= target_width:
+        return max(1, scaled_width), target_height
+    return target_width, max(1, target_width * height // width)
+
+
+def halve(img: np.ndarray) -> np.ndarray:
+    """Уменьшение вдвое усреднением блоков 2x2"""
+    height, width = img.shape[:2]
+    return cv2.resize(img, ((width + 1) // 2, (height + 1) // 2), interpolation=cv2.INTER_AREA)
+
+
+class DisplayPyramid:
+    """Уменьшенные копии изображения для показа на экране.
+
+    Уровень k - изображение, уменьшенное в 2^k раз. Уровни строятся по мере
+    надобности, а итоговая картинка для размера области показа получается из
+    ближайшего уровня не меньше этого размера и запоминается. Поэтому
+    перерисовка и смена размера окна не трогают полное разрешение.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.levels = [image]
+        self._rendered_size = None
+        self._rendered = None
+
+    def get_level(self, width: int, height: int) -> np.ndarray:
+        """Наименьший уровень, который не меньше width x height"""
+        level = self.levels[-1]
+        while level.shape[1] >= 2 * width and level.shape[0] >= 2 * height:
+            level = halve(level)
+            self.levels.append(level)
+
+        for level in self.levels:
+            if level.shape[1] < 2 * width or level.shape[0] < 2 * height:
+                return level
+        return self.levels[-1]
+
+    def render(self, target_size: Tuple[int, int]) -> np.ndarray:
+        """Изображение (BGR), вписанное в target_size"""
+        if self._rendered_size == target_size:
+            return self._rendered
+
+        height, width = self.image.shape[:2]
+        display_width, display_height = fit_size(width, height, target_size[0], target_size[1])
+        level = self.get_level(display_width, display_height)
+        if level.shape[1] == display_width and level.shape[0] == display_height:
+            rendered = level
+        else:
+            interpolation = cv2.INTER_AREA if level.shape[1] > display_width else cv2.INTER_LINEAR
+            rendered = cv2.resize(level, (display_width, display_height), interpolation=interpolation)
+
+        self._rendered_size = target_size
+        self._rendered = rendered
+        return rendered
+
+
+def render_for_display(img: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+    """Однократное уменьшение изображения для показа (тем же способом, что и в пирамиде)"""
+    return DisplayPyramid(img).render(target_size)
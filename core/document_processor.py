@@ -1,25 +1,88 @@
 import os
-import tempfile
 import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from types import SimpleNamespace
 import cv2
 import numpy as np
-from docx import Document
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Callable, Optional, Union
+
+from core.image_processor import ImageProcessor, DEFAULT_TILE_MEMORY_BUDGET
+from core.region_mask import RegionMask, DEFAULT_STROKE_TOLERANCE
+from core.docx_writer import write_docx_with_replacements
+from core.media_store import MediaStore, DEFAULT_IMAGE_CACHE_BUDGET, MAIN_DOCUMENT_PART, get_part_kind
+from core.detection_cache import DetectionCache, content_hash, settings_key
+from core.image_encoder import ImageEncoder, DEFAULT_ENCODE_PARAMS, SIGNATURE_SIZE, detect_format
+from core import tracing
+
+
+# Бюджет памяти для закодированных замен до сохранения документа (байт);
+# сверх него готовые результаты выгружаются во временные файлы
+DEFAULT_REPLACEMENT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Детектор цветов внутри процесса-воркера (создается инициализатором пула)
+_worker_detector = None
+
+
+def _init_scan_worker(settings: Dict[str, Any]):
+    """Инициализация процесса-воркера сканирования"""
+    global _worker_detector
+    _worker_detector = ImageProcessor(SimpleNamespace(**settings))
+
+
+def _scan_image_in_worker(image_bytes: bytes) -> bool:
+    """Сканирование изображения в процессе-воркере"""
+    return _scan_image_bytes(_worker_detector, image_bytes)
+
+
+def _scan_image_bytes(color_detector, image_bytes: bytes) -> bool:
+    """Декодирование изображения и проверка наличия целевых цветов"""
+    with tracing.span('decode', bytes=len(image_bytes)) as stage:
+        image_array = np.frombuffer(image_bytes, np.uint8)
+        # Серые изображения остаются одноканальными и отсекаются без анализа
+        img = cv2.imdecode(image_array, cv2.IMREAD_ANYCOLOR)
+        if img is None:
+            return False
+        stage.set(width=img.shape[1], height=img.shape[0])
+
+    with tracing.span('detect', width=img.shape[1], height=img.shape[0]) as stage:
+        found = color_detector.has_target_colors(img)
+        stage.set(found=found)
+    return found
 
 
 class DocumentProcessor:
     def __init__(self):
         self.docx_path = None
-        self.doc = None
+        self.media_store = None
+        # Изображения всех частей пакета в порядке чтения: имя элемента архива -> ссылки
+        # на него ({'part', 'rel_id', 'order', 'page'}, см. MediaStore.get_media_index)
+        self.media_index = {}
         self.image_parts = []
         self.filtered_indices = []
-        self.original_paths = []
-        self.processed_paths = []
 
-        # Временные файлы
-        self.temp_dir = tempfile.mkdtemp()
-        self.comparison_dir = os.path.join(self.temp_dir, "comparison")
-        os.makedirs(self.comparison_dir, exist_ok=True)
+        # Результат по позициям очереди: индекс замененного изображения или None (пропущено)
+        self.processed_images = []
+
+        # Замененные изображения: индекс -> байты, Future кодирования или путь к файлу
+        self.replaced_images = {}
+        # Выгруженные во временную папку замены (индексы) и сама папка
+        self._spilled_images = set()
+        self._spill_dir = None
+
+        # Замены пикселей по индексу изображения - для отчета: список слоев
+        # (RegionMask замененных пикселей, цвет замены RGB) в порядке обработки
+        self.change_masks = {}
+
+        # Кодирование в исходном формате (параметры: формат -> флаги cv2.imencode)
+        self.encode_params = {fmt: list(params) for fmt, params in DEFAULT_ENCODE_PARAMS.items()}
+        self.encoder = None
+
+        # Папка отладочного вывода (оригиналы и результаты); None - файлы не пишутся
+        self.debug_dir = None
 
         # Цвета для замены
         self.target_colors = [(236, 19, 27)]  # Список целевых цветов
@@ -30,86 +93,448 @@ class DocumentProcessor:
         self.saturation_threshold = 100
         self.value_threshold = 100
 
+        # Параллельное сканирование: 'thread' (OpenCV отпускает GIL) или 'process'
+        self.scan_executor = 'thread'
+        self.scan_workers = None  # None - по числу ядер
+
+        # Бюджет памяти для кэша декодированных изображений (байт)
+        self.image_cache_budget = DEFAULT_IMAGE_CACHE_BUDGET
+
+        # Бюджет рабочей памяти обработки больших изображений полосами (байт)
+        self.tile_memory_budget = DEFAULT_TILE_MEMORY_BUDGET
+
+        # Бюджет памяти для закодированных, но еще не сохраненных замен (байт)
+        self.replacement_memory_budget = DEFAULT_REPLACEMENT_MEMORY_BUDGET
+
+        # Допуск упрощения контуров лассо и масок при рисовании (пиксели изображения, 0 - без упрощения)
+        self.stroke_tolerance = DEFAULT_STROKE_TOLERANCE
+
+        # Постоянный кэш результатов обнаружения (None в пути - папка кэша пользователя)
+        self.use_detection_cache = True
+        self.detection_cache_path = None
+        self.detection_cache = None
+        # Кэш открывается из потока сканирования, пула предзагрузки и UI
+        self._detection_cache_lock = threading.Lock()
+        self._content_hashes = {}  # имя элемента архива -> хэш содержимого
+
     def load_document(self, docx_path: str) -> bool:
-        """Загрузка Word документа"""
+        """Загрузка Word документа.
+
+        Документ целиком не разбирается: читаются каталог архива и связи
+        всех частей (основной текст, колонтитулы, сноски, примечания и т.д.),
+        байты изображений загружаются по требованию.
+        """
         try:
-            self.docx_path = docx_path
-            self.doc = Document(docx_path)
-            self.image_parts = []
+            with tracing.span('load_document', path=os.path.basename(docx_path)) as stage:
+                self.close_document()
+                self.docx_path = docx_path
+                self.media_store = MediaStore(docx_path, self.image_cache_budget)
+                self.image_parts = []
+                self.processed_images = []
+                self.replaced_images = {}
+                self.change_masks = {}
+                self._content_hashes = {}
 
-            # Получаем все изображения
-            for rel_id, rel in self.doc.part.rels.items():
-                if "image" in rel.reltype:
-                    self.image_parts.append(rel.target_part)
+                # Получаем изображения всего пакета; одинаковые по содержимому обрабатываются один раз
+                self.media_index = self.media_store.get_media_index(MAIN_DOCUMENT_PART)
+                self.image_parts = self.media_store.get_unique_entries(self.media_index)
 
-            if not self.image_parts:
-                return False
+                duplicates = len(self.media_index) - len(self.image_parts)
+                if duplicates:
+                    print(f"Повторяющихся изображений объединено: {duplicates}")
 
-            return True
+                part_counts = self.get_part_counts()
+                if set(part_counts) - {'document'}:
+                    print("Изображения по частям документа: " +
+                          ", ".join(f"{kind} {count}" for kind, count in part_counts.items()))
+
+                stage.set(images=len(self.image_parts), duplicates=duplicates, parts=part_counts)
+                if not self.image_parts:
+                    return False
+
+                return True
         except Exception as e:
             print(f"Ошибка загрузки документа: {e}")
             return False
 
-    def filter_images_with_red(self, color_detector) -> None:
-        """Фильтрация изображений с целевыми цветами"""
-        self.filtered_indices = []
+    def get_image_sources(self, image_idx: int) -> List[Dict[str, Any]]:
+        """Ссылки на изображение из частей документа (с учетом одинаковых по содержимому элементов)"""
+        return [dict(reference, name=name, kind=get_part_kind(reference['part']))
+                for name in self.image_parts[image_idx].names
+                for reference in self.media_index.get(name, [])]
 
-        for i, image_part in enumerate(self.image_parts):
-            image_bytes = image_part.blob
-            image_array = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    def get_reference_count(self, image_idx: int) -> int:
+        """Сколько раз изображение встречается в разметке документа"""
+        return sum(1 for source in self.get_image_sources(image_idx) if source['order'] is not None)
 
-            if img is not None:
-                # Проверяем все целевые цвета
-                has_target_color = False
-                for target_color in self.target_colors:
-                    red_count = color_detector.count_color_pixels(img, target_color)
-                    if red_count > 0:
-                        has_target_color = True
-                        break
+    def get_image_page(self, image_idx: int) -> Optional[int]:
+        """Примерная страница первого появления изображения в основном тексте"""
+        pages = [source['page'] for source in self.get_image_sources(image_idx) if source['page'] is not None]
+        return min(pages) if pages else None
 
+    def get_part_counts(self) -> Dict[str, int]:
+        """Число изображений по видам частей (изображение считается в части первого упоминания)"""
+        counts = {}
+        for image_part in self.image_parts:
+            part_name = self.media_index[image_part.name][0]['part']
+            kind = get_part_kind(part_name)
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    def filter_images_with_red(self, color_detector,
+                               progress_callback: Optional[Callable[[int, int], None]] = None) -> None:
+        """Фильтрация изображений с целевыми цветами"""
+        self.filtered_indices = []
+        total = len(self.image_parts)
+
+        with tracing.span('scan', images=total) as stage:
+            for i, has_target_color in self.iter_scan_results(color_detector):
                 if has_target_color:
                     self.filtered_indices.append(i)
+                if progress_callback:
+                    progress_callback(i + 1, total)
+            stage.set(matched=len(self.filtered_indices))
 
         print(f"Изображения с целевыми цветами в порядке документа: {self.filtered_indices}")
 
-    def save_original_image(self, index: int, image_idx: int) -> str:
-        """Сохранение оригинального изображения"""
-        image_part = self.image_parts[image_idx]
-        orig_path = os.path.join(self.comparison_dir,
+    def get_detection_settings(self) -> Dict[str, Any]:
+        """Текущие настройки обнаружения цветов (для передачи в воркеры)"""
+        return {
+            'target_colors': list(self.target_colors),
+            'replacement_color': self.replacement_color,
+            'color_tolerance': self.color_tolerance,
+            'saturation_threshold': self.saturation_threshold,
+            'value_threshold': self.value_threshold,
+        }
+
+    def iter_scan_results(self, color_detector,
+                          cancelled: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[int, bool]]:
+        """Параллельное сканирование изображений.
+
+        Декодирование и поиск цветов выполняются в пуле потоков или процессов
+        (self.scan_executor), результаты выдаются по мере готовности строго в
+        порядке документа: (индекс изображения, есть ли целевые цвета).
+        """
+        workers = self.scan_workers or os.cpu_count() or 1
+        detection_key = settings_key(self)
+
+        if self.scan_executor == 'process':
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_scan_worker,
+                                           initargs=(self.get_detection_settings(),))
+
+            def scan(image_bytes):
+                return executor.submit(_scan_image_in_worker, image_bytes)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+            def scan(image_bytes):
+                return executor.submit(_scan_image_bytes, color_detector, image_bytes)
+
+        def submit(image_idx):
+            """Задача сканирования; известные изображения берутся из кэша без декодирования"""
+            image_bytes = self.get_image_blob(image_idx)
+            blob_hash = self.get_content_hash(image_idx, image_bytes)
+            cached = self._cache_call('get', blob_hash, detection_key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached[0])
+                return image_idx, future, None
+            return image_idx, scan(image_bytes), blob_hash
+
+        # Ограничиваем число задач в полете, чтобы не держать все blob-ы в очереди пула
+        window = workers * 2
+        pending = deque()
+        indices = iter(range(len(self.image_parts)))
+
+        try:
+            for i in indices:
+                pending.append(submit(i))
+                if len(pending) >= window:
+                    break
+
+            while pending:
+                if cancelled and cancelled():
+                    return
+                i, future, blob_hash = pending.popleft()
+                has_target_color = future.result()
+                if blob_hash is not None:
+                    self._cache_call('put', blob_hash, detection_key, has_target_color)
+
+                next_idx = next(indices, None)
+                if next_idx is not None:
+                    pending.append(submit(next_idx))
+
+                yield i, has_target_color
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def save_original_image(self, index: int, image_idx: int) -> Optional[str]:
+        """Сохранение оригинального изображения (только в режиме отладки)"""
+        if not self.debug_dir:
+            return None
+
+        os.makedirs(self.debug_dir, exist_ok=True)
+        orig_path = os.path.join(self.debug_dir,
                                  f"original_{index + 1:03d}_docpos_{image_idx + 1:03d}.png")
 
         with open(orig_path, 'wb') as f:
-            f.write(image_part.blob)
+            f.write(self.get_image_blob(image_idx))
 
         return orig_path
 
-    def update_image_in_document(self, image_idx: int, proc_path: str) -> bool:
-        """Обновление изображения в документе"""
+    def get_image_blob(self, image_idx: int) -> bytes:
+        """Текущее содержимое изображения (с учетом уже внесенных замен)"""
+        replacement = self.replaced_images.get(image_idx)
+        if replacement is not None:
+            return self._resolve_replacement(replacement)
+        return self.image_parts[image_idx].blob
+
+    def get_original_blob(self, image_idx: int) -> bytes:
+        """Исходное содержимое изображения из документа"""
+        return self.image_parts[image_idx].blob
+
+    @staticmethod
+    def _resolve_replacement(replacement: Union[bytes, str, Future]) -> bytes:
+        """Байты замены: ожидание кодирования или чтение файла"""
+        if isinstance(replacement, Future):
+            return replacement.result()
+        if isinstance(replacement, str):
+            with open(replacement, 'rb') as f:
+                return f.read()
+        return replacement
+
+    def get_image(self, image_idx: int) -> Optional[np.ndarray]:
+        """Декодированное изображение (через кэш с ограничением по памяти)"""
+        return self.media_store.get_image(self.image_parts[image_idx].name,
+                                          lambda: self.get_image_blob(image_idx))
+
+    def decode_image(self, image_idx: int) -> Optional[np.ndarray]:
+        """Изменяемая копия изображения в обход кэша (для обработки на месте)"""
+        image_bytes = self.get_image_blob(image_idx)
+        with tracing.span('decode', part=self.image_parts[image_idx].name, bytes=len(image_bytes)):
+            return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    def get_content_hash(self, image_idx: int, image_bytes: Optional[bytes] = None) -> str:
+        """Хэш текущего содержимого изображения (вычисляется один раз)"""
+        name = self.image_parts[image_idx].name
+        blob_hash = self._content_hashes.get(name)
+        if blob_hash is None:
+            if image_bytes is None:
+                image_bytes = self.get_image_blob(image_idx)
+            blob_hash = content_hash(image_bytes)
+            self._content_hashes[name] = blob_hash
+        return blob_hash
+
+    def count_target_pixels(self, image_idx: int, color_detector) -> List[int]:
+        """Число пикселей каждого целевого цвета (из постоянного кэша, если известно)"""
+        detection_key = settings_key(self)
+        blob_hash = self.get_content_hash(image_idx)
+        counts = self._cache_call('get_counts', blob_hash, detection_key)
+        if counts is not None:
+            return counts
+
+        img = self.get_image(image_idx)
+        if img is None:
+            return [0] * len(self.target_colors)
+        counts = color_detector.count_target_pixels(img)
+        self._cache_call('put', blob_hash, detection_key, any(counts), counts)
+        return counts
+
+    def get_detection_cache(self) -> Optional[DetectionCache]:
+        """Постоянный кэш обнаружения (открывается при первом обращении)"""
+        if self.use_detection_cache and self.detection_cache is None:
+            with self._detection_cache_lock:
+                if self.use_detection_cache and self.detection_cache is None:
+                    try:
+                        self.detection_cache = DetectionCache(self.detection_cache_path)
+                    except Exception as e:
+                        print(f"Кэш обнаружения недоступен: {e}")
+                        self.use_detection_cache = False
+        return self.detection_cache if self.use_detection_cache else None
+
+    def _cache_call(self, method: str, *args):
+        """Обращение к кэшу обнаружения; ошибки кэша не прерывают обработку"""
+        cache = self.get_detection_cache()
+        if cache is None:
+            return None
         try:
-            for rel_id, rel in self.doc.part.rels.items():
-                if hasattr(rel, 'target_part') and rel.target_part == self.image_parts[image_idx]:
-                    with open(proc_path, 'rb') as f:
-                        image_data = f.read()
-                    rel.target_part._blob = image_data
-                    print(f"✓ Обновлено изображение {image_idx + 1} в документе")
-                    return True
-            print(f"⚠ Не найдена связь для изображения {image_idx + 1}")
-            return False
+            return getattr(cache, method)(*args)
+        except Exception as e:
+            print(f"Ошибка кэша обнаружения: {e}")
+            return None
+
+    def update_image_in_document(self, image_idx: int, processed: Union[np.ndarray, bytes, str],
+                                 change_mask=None) -> bool:
+        """Обновление изображения в документе.
+
+        processed - обработанное изображение (кодируется в фоне в формате
+        исходного с параметрами encode_params), готовые байты или путь к файлу.
+        change_mask - маска замененных пикселей текущим цветом замены (отчет
+        строится по исходному изображению и маскам, без декодирования
+        результата). Содержимое попадает в архив при сохранении документа.
+        """
+        try:
+            image_part = self.image_parts[image_idx]
+            if image_part.name not in self.media_index:
+                print(f"⚠ Не найдена связь для изображения {image_idx + 1}")
+                return False
+
+            described_by_masks = isinstance(processed, np.ndarray)
+            if described_by_masks:
+                processed = self._encode_processed(image_idx, processed)
+
+            # Повторная обработка заменяет прежний результат; в архив он попадет один раз
+            self._discard_spilled(image_idx)
+            self.replaced_images[image_idx] = processed
+            self._spill_replacements()
+            # Повторная обработка идет поверх прежнего результата - маска добавляется слоем;
+            # готовые байты или файл масками не описываются
+            if change_mask is not None:
+                self.change_masks.setdefault(image_idx, []).append(
+                    (change_mask, tuple(self.replacement_color)))
+            elif not described_by_masks:
+                self.change_masks.pop(image_idx, None)
+            for name in image_part.names:
+                self.media_store.invalidate(name)
+                self._content_hashes.pop(name, None)
+            print(f"✓ Обновлено изображение {image_idx + 1} в документе")
+            return True
         except Exception as e:
             print(f"❌ Ошибка обновления изображения {image_idx + 1}: {e}")
             return False
 
-    def save_processed_document(self) -> str:
+    def _spill_replacements(self):
+        """Выгрузка готовых результатов кодирования на диск сверх бюджета памяти.
+
+        Кодирование по-прежнему идет в память; когда готовые байты замен в
+        сумме превышают replacement_memory_budget, самые старые из них
+        записываются во временные файлы, и в replaced_images остается путь.
+        """
+        in_memory = []
+        total = 0
+        for image_idx, replacement in self.replaced_images.items():
+            if isinstance(replacement, Future):
+                # Незавершенное и неудачное кодирование остается как есть
+                if not replacement.done() or replacement.exception() is not None:
+                    continue
+                replacement = replacement.result()
+            if isinstance(replacement, bytes):
+                in_memory.append((image_idx, replacement))
+                total += len(replacement)
+
+        if total <= self.replacement_memory_budget:
+            return
+
+        with tracing.span('spill_replacements') as stage:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix='color_redact_')
+            spilled = 0
+            for image_idx, data in in_memory:
+                if total <= self.replacement_memory_budget:
+                    break
+                path = os.path.join(self._spill_dir, f"replacement_{image_idx:04d}.bin")
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.replaced_images[image_idx] = path
+                self._spilled_images.add(image_idx)
+                total -= len(data)
+                spilled += len(data)
+            stage.set(bytes=spilled)
+
+    def _discard_spilled(self, image_idx: int):
+        """Удаление временного файла прежней замены изображения"""
+        if image_idx not in self._spilled_images:
+            return
+        self._spilled_images.discard(image_idx)
+        try:
+            os.remove(self.replaced_images[image_idx])
+        except OSError:
+            pass
+
+    def _encode_processed(self, image_idx: int, img: np.ndarray) -> Future:
+        """Постановка в очередь кодирования в формате исходного изображения"""
+        image_part = self.image_parts[image_idx]
+        image_format = detect_format(self.media_store.read_header(image_part.name, SIGNATURE_SIZE),
+                                     image_part.name)
+
+        debug_path = None
+        if self.debug_dir:
+            os.makedirs(self.debug_dir, exist_ok=True)
+            debug_path = os.path.join(self.debug_dir,
+                                      f"processed_docpos_{image_idx + 1:03d}{image_format}")
+
+        if self.encoder is None:
+            self.encoder = ImageEncoder(self.encode_params)
+        return self.encoder.submit(img, image_format, debug_path)
+
+    def save_processed_document(self, output_path: Optional[str] = None) -> str:
         """Сохранение обработанного документа"""
-        base_name = os.path.splitext(self.docx_path)[0]
-        output_path = f"{base_name}_processed.docx"
-        self.doc.save(output_path)
+        if output_path is None:
+            base_name = os.path.splitext(self.docx_path)[0]
+            output_path = f"{base_name}_processed.docx"
+
+        with tracing.span('save', images=len(self.replaced_images)):
+            replacements = self.collect_replacements()
+            # Копируем архив поэлементно, перезаписывая только замененные изображения
+            with tracing.span('write_archive', parts=len(replacements)):
+                write_docx_with_replacements(self.docx_path, output_path, replacements)
         return output_path
 
+    def collect_replacements(self) -> Dict[str, Callable[[], Union[bytes, str]]]:
+        """Все замены для записи архива: имя элемента -> функция получения содержимого.
+
+        Содержимое забирается (и при необходимости дожидается кодирования)
+        только в момент записи элемента, поэтому в памяти одновременно
+        находятся лишь еще не выгруженные на диск замены. Элементы с тем же
+        содержимым получают одну и ту же замену.
+        """
+        replacements = {}
+        for image_idx in self.replaced_images:
+            content = partial(self._replacement_content, image_idx)
+            for name in self.image_parts[image_idx].names:
+                replacements[name] = content
+        return replacements
+
+    def _replacement_content(self, image_idx: int) -> Union[bytes, str]:
+        """Содержимое замены для записи: путь к файлу как есть, иначе байты"""
+        replacement = self.replaced_images[image_idx]
+        if isinstance(replacement, str):
+            return replacement
+        return self._resolve_replacement(replacement)
+
+    def get_report_jobs(self) -> Tuple[List[Tuple[int, str, List[Tuple[RegionMask, Tuple[int, int, int]]]]],
+                                       List[Tuple[int, str]]]:
+        """Данные для отчета: измененные изображения со слоями замен и изображения без целевых цветов"""
+        changed = [(image_idx, self.image_parts[image_idx].name, list(self.change_masks[image_idx]))
+                   for image_idx in sorted(self.replaced_images)
+                   if self.change_masks.get(image_idx)]
+
+        filtered = set(self.filtered_indices)
+        untouched = [(image_idx, image_part.name) for image_idx, image_part in enumerate(self.image_parts)
+                     if image_idx not in filtered]
+        return changed, untouched
+
+    def close_document(self):
+        """Закрытие архива текущего документа"""
+        if self.media_store is not None:
+            self.media_store.close()
+            self.media_store = None
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        self._spilled_images = set()
+
     def cleanup(self):
-        """Очистка временных файлов"""
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        """Завершение кодирования и закрытие документа и кэшей"""
+        if self.encoder is not None:
+            self.encoder.shutdown()
+            self.encoder = None
+        self.close_document()
+        with self._detection_cache_lock:
+            if self.detection_cache is not None:
+                self.detection_cache.close()
+                self.detection_cache = None
 
     def add_target_color(self, color: Tuple[int, int, int]):
         """Добавление целевого цвета"""
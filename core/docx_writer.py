@@ -0,0 +1,97 @@
+import os
+import copy
+import shutil
+import struct
+import zipfile
+from typing import Callable, Dict, Union
+
+# Размер блока при потоковом копировании данных архива
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Локальный заголовок файла в ZIP: сигнатура и фиксированная длина
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER_SIZE = 30
+
+# Бит 3 флагов: размеры и CRC записаны в дескрипторе после данных
+FLAG_DATA_DESCRIPTOR = 0x08
+
+
+def write_docx_with_replacements(source_path: str, output_path: str,
+                                 replacements: Dict[str, Union[str, bytes, Callable[[], Union[str, bytes]]]]) -> None:
+    """Запись копии DOCX с заменой отдельных элементов архива.
+
+    replacements: имя элемента в архиве (например, 'word/media/image1.png')
+    -> путь к файлу с новым содержимым, сами байты или функция, возвращающая
+    одно из них (вызывается непосредственно перед записью элемента, поэтому
+    содержимое замен не нужно держать в памяти все сразу). Неизмененные элементы
+    копируются из исходного архива как есть, без распаковки и повторного
+    сжатия; данные идут блоками, поэтому память не зависит от размера документа.
+    """
+    with zipfile.ZipFile(source_path) as source, \
+            open(source_path, 'rb') as raw_source, \
+            zipfile.ZipFile(output_path, 'w') as target:
+        for info in source.infolist():
+            replacement = replacements.get(info.filename)
+            if replacement is None:
+                _copy_raw_entry(raw_source, target, info)
+            else:
+                if callable(replacement):
+                    replacement = replacement()
+                _write_replaced_entry(target, info, replacement)
+
+
+def _copy_raw_entry(raw_source, target: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """Копирование сжатых данных элемента без перекодирования.
+
+    zipfile не умеет копировать элементы в сжатом виде, поэтому локальный
+    заголовок пишется заново, данные переносятся напрямую, а запись
+    центрального каталога добавляется в target.filelist - при закрытии
+    архива zipfile сам сформирует каталог.
+    """
+    raw_source.seek(info.header_offset)
+    header = raw_source.read(LOCAL_HEADER_SIZE)
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Поврежден локальный заголовок: {info.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    data_offset = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+    new_info = copy.copy(info)
+    # Размеры и CRC известны из центрального каталога - пишем их в заголовок
+    new_info.flag_bits &= ~FLAG_DATA_DESCRIPTOR
+    # Дополнительные поля (в т.ч. zip64) zipfile сформирует сам
+    new_info.extra = b''
+    new_info.header_offset = target.fp.tell()
+
+    zip64 = (info.file_size > zipfile.ZIP64_LIMIT or
+             info.compress_size > zipfile.ZIP64_LIMIT)
+    target.fp.write(new_info.FileHeader(zip64))
+
+    raw_source.seek(data_offset)
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = raw_source.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Неожиданный конец данных: {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    target.start_dir = target.fp.tell()
+
+
+def _write_replaced_entry(target: zipfile.ZipFile, info: zipfile.ZipInfo,
+                          replacement: Union[str, bytes]) -> None:
+    """Запись нового содержимого элемента с тем же именем и способом сжатия"""
+    new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.external_attr = info.external_attr
+
+    if isinstance(replacement, bytes):
+        target.writestr(new_info, replacement)
+        return
+
+    # Как и zipfile, закладываем запас на случай, если сжатие увеличит размер
+    force_zip64 = os.path.getsize(replacement) * 1.05 > zipfile.ZIP64_LIMIT
+    with open(replacement, 'rb') as src, target.open(new_info, 'w', force_zip64=force_zip64) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
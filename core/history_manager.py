@@ -1,91 +1,169 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+
+# Ограничение памяти журнала действий (байт, оценка)
+DEFAULT_HISTORY_BYTES = 64 * 1024 * 1024
+
+# Через сколько действий сохраняется контрольная точка состояния
+CHECKPOINT_INTERVAL = 32
+
+# Оценка памяти действия без учета точек и маски
+OPERATION_OVERHEAD = 512
+POINT_SIZE = 120
+
+ACTION_ADD = 'add'
+ACTION_REMOVE = 'remove'
 
 
 class HistoryManager:
-    def __init__(self, max_history_size: int = 50):
-        self.history = []
-        self.history_index = -1
-        self.max_history_size = max_history_size
+    """Журнал действий с регионами для отмены и повтора.
+
+    Хранятся не полные копии состояния, а изменения: добавление или
+    удаление региона ('regions') либо маски ('mask_regions') по индексу.
+    Регионы после записи не изменяются, поэтому журнал и контрольные точки
+    ссылаются на те же словари, что и ImageProcessor, без копирования точек.
+    """
+
+    def __init__(self, max_history_bytes: int = DEFAULT_HISTORY_BYTES,
+                 checkpoint_interval: int = CHECKPOINT_INTERVAL):
+        self.max_history_bytes = max_history_bytes
+        self.checkpoint_interval = checkpoint_interval
         self.adding_to_history = False
 
-    def add_state(self, regions: List[Dict], mask_regions: List[Dict]) -> None:
-        """Добавление состояния в историю"""
+        self.operations = []
+        self.position = 0  # число примененных действий журнала
+        self.history_bytes = 0
+
+        # Состояние перед первым действием журнала и контрольные точки:
+        # позиция -> (регионы, маски) в виде кортежей ссылок
+        self.base_state = ((), ())
+        self.checkpoints = {}
+
+    def record_add(self, kind: str, region: Dict[str, Any], index: Optional[int] = None) -> None:
+        """Запись добавления региона (kind: 'regions' или 'mask_regions')"""
+        self._record({'action': ACTION_ADD, 'kind': kind, 'index': index, 'region': region})
+
+    def record_remove(self, kind: str, index: int, region: Dict[str, Any]) -> None:
+        """Запись удаления региона с указанным индексом"""
+        self._record({'action': ACTION_REMOVE, 'kind': kind, 'index': index, 'region': region})
+
+    def _record(self, operation: Dict[str, Any]) -> None:
         if self.adding_to_history:
             return
 
         self.adding_to_history = True
 
         try:
-            state = {
-                'regions': self._deep_copy_regions(regions),
-                'mask_regions': self._deep_copy_regions(mask_regions)
-            }
+            # Отмененные действия больше нельзя повторить
+            if self.position < len(self.operations):
+                for dropped in self.operations[self.position:]:
+                    self.history_bytes -= dropped['size']
+                del self.operations[self.position:]
+                self.checkpoints = {pos: state for pos, state in self.checkpoints.items()
+                                    if pos <= self.position}
+
+            if operation['action'] == ACTION_ADD and operation['index'] is None:
+                operation['index'] = len(self.get_state()[operation['kind']])
+            operation['size'] = self._operation_size(operation['region'])
 
-            # Удаляем состояния после текущего индекса
-            if self.history_index < len(self.history) - 1:
-                self.history = self.history[:self.history_index + 1]
+            self.operations.append(operation)
+            self.position = len(self.operations)
+            self.history_bytes += operation['size']
 
-            # Добавляем новое состояние
-            self.history.append(state)
-            self.history_index = len(self.history) - 1
+            if self.position % self.checkpoint_interval == 0:
+                state = self.get_state()
+                self.checkpoints[self.position] = (tuple(state['regions']), tuple(state['mask_regions']))
 
-            # Ограничиваем размер истории
-            if len(self.history) > self.max_history_size:
-                self.history.pop(0)
-                self.history_index -= 1
+            self._trim()
 
         finally:
             self.adding_to_history = False
 
-    def undo(self) -> Dict[str, List]:
-        """Отмена последнего действия"""
-        if self.history_index > 0:
-            self.history_index -= 1
-            return self._get_current_state()
+    def undo(self) -> Optional[Dict[str, Any]]:
+        """Отмена последнего действия: возвращает обратное действие для применения"""
+        if self.position > 0:
+            self.position -= 1
+            return self._inverse(self.operations[self.position])
         return None
 
-    def redo(self) -> Dict[str, List]:
-        """Повтор отмененного действия"""
-        if self.history_index < len(self.history) - 1:
-            self.history_index += 1
-            return self._get_current_state()
+    def redo(self) -> Optional[Dict[str, Any]]:
+        """Повтор отмененного действия: возвращает действие для применения"""
+        if self.position < len(self.operations):
+            self.position += 1
+            return self.operations[self.position - 1]
         return None
 
-    def _get_current_state(self) -> Dict[str, List]:
-        """Получение текущего состояния"""
-        if 0 <= self.history_index < len(self.history):
-            return self.history[self.history_index]
-        return {'regions': [], 'mask_regions': []}
-
-    def _deep_copy_regions(self, regions: List[Dict]) -> List[Dict]:
-        """Глубокое копирование регионов"""
-        copied_regions = []
-        for region in regions:
-            if region['type'] in ['rectangle', 'ellipse']:
-                copied_regions.append({
-                    'type': region['type'],
-                    'x1': region['x1'],
-                    'y1': region['y1'],
-                    'x2': region['x2'],
-                    'y2': region['y2']
-                })
-            elif region['type'] in ['lasso', 'mask']:
-                copied_regions.append({
-                    'type': region['type'],
-                    'tool': region.get('tool', 'draw'),
-                    'points': region['points'].copy()
-                })
-        return copied_regions
+    def get_state(self, position: Optional[int] = None) -> Dict[str, List]:
+        """Состояние на позиции журнала: ближайшая контрольная точка и повтор действий"""
+        if position is None:
+            position = self.position
+
+        start, (regions, mask_regions) = 0, self.base_state
+        for pos, state in self.checkpoints.items():
+            if start < pos <= position:
+                start, (regions, mask_regions) = pos, state
+
+        state = {'regions': list(regions), 'mask_regions': list(mask_regions)}
+        for operation in self.operations[start:position]:
+            apply_operation(state, operation)
+        return state
+
+    def _trim(self) -> None:
+        """Удаление самых старых действий сверх лимита памяти.
+
+        Начало журнала переносится на контрольную точку, поэтому состояние
+        на новой границе всегда известно.
+        """
+        while self.history_bytes > self.max_history_bytes:
+            positions = sorted(pos for pos in self.checkpoints if 0 < pos < self.position)
+            if not positions:
+                break
+
+            start = positions[0]
+            self.base_state = self.checkpoints.pop(start)
+            for dropped in self.operations[:start]:
+                self.history_bytes -= dropped['size']
+            del self.operations[:start]
+            self.position -= start
+            self.checkpoints = {pos - start: state for pos, state in self.checkpoints.items()}
+
+    @staticmethod
+    def _inverse(operation: Dict[str, Any]) -> Dict[str, Any]:
+        action = ACTION_REMOVE if operation['action'] == ACTION_ADD else ACTION_ADD
+        return {'action': action, 'kind': operation['kind'],
+                'index': operation['index'], 'region': operation['region']}
+
+    @staticmethod
+    def _operation_size(region: Dict[str, Any]) -> int:
+        """Оценка памяти, удерживаемой действием"""
+        points = region.get('points', ())
+        # Точки в массиве (упрощенный контур) занимают ровно nbytes, в списке - по POINT_SIZE
+        size = OPERATION_OVERHEAD + getattr(points, 'nbytes', len(points) * POINT_SIZE)
+        if region.get('raster') is not None:
+            size += region['raster'].nbytes
+        return size
 
     def can_undo(self) -> bool:
         """Можно ли отменить"""
-        return self.history_index > 0
+        return self.position > 0
 
     def can_redo(self) -> bool:
         """Можно ли повторить"""
-        return self.history_index < len(self.history) - 1
+        return self.position < len(self.operations)
 
     def clear(self):
         """Очистка истории"""
-        self.history.clear()
-        self.history_index = -1
\ No newline at end of file
+        self.operations.clear()
+        self.position = 0
+        self.history_bytes = 0
+        self.base_state = ((), ())
+        self.checkpoints.clear()
+
+
+def apply_operation(state: Dict[str, List], operation: Dict[str, Any]) -> None:
+    """Применение действия журнала к спискам регионов state"""
+    regions = state[operation['kind']]
+    if operation['action'] == ACTION_ADD:
+        regions.insert(operation['index'], operation['region'])
+    else:
+        del regions[operation['index']]
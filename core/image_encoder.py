@@ -0,0 +1,91 @@
+import posixpath
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from core import tracing
+
+
+# Сигнатуры форматов, которые OpenCV умеет кодировать
+FORMAT_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tiff'),
+    (b'MM\x00*', '.tiff'),
+]
+
+EXTENSION_FORMATS = {
+    '.png': '.png',
+    '.jpg': '.jpg',
+    '.jpeg': '.jpg',
+    '.jpe': '.jpg',
+    '.bmp': '.bmp',
+    '.tif': '.tiff',
+    '.tiff': '.tiff',
+    '.webp': '.webp',
+}
+
+# Формат для изображений, которые OpenCV не кодирует (GIF, EMF и т.п.)
+FALLBACK_FORMAT = '.png'
+
+# Число байт начала файла, достаточное для определения формата
+SIGNATURE_SIZE = 16
+
+# Параметры кодирования по умолчанию
+DEFAULT_ENCODE_PARAMS = {
+    '.jpg': [cv2.IMWRITE_JPEG_QUALITY, 95],
+    '.png': [cv2.IMWRITE_PNG_COMPRESSION, 3],
+    '.webp': [cv2.IMWRITE_WEBP_QUALITY, 95],
+}
+
+
+def detect_format(header: bytes, name: str = '') -> str:
+    """Формат изображения по первым байтам (или по расширению имени)"""
+    for signature, image_format in FORMAT_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    return EXTENSION_FORMATS.get(posixpath.splitext(name)[1].lower(), FALLBACK_FORMAT)
+
+
+def encode_image(img: np.ndarray, image_format: str,
+                 params: Optional[Dict[str, List[int]]] = None) -> bytes:
+    """Кодирование изображения в памяти в указанном формате"""
+    if params is None:
+        params = DEFAULT_ENCODE_PARAMS
+    success, buffer = cv2.imencode(image_format, img, params.get(image_format, []))
+    if not success:
+        raise ValueError(f"Не удалось закодировать изображение в {image_format}")
+    return buffer.tobytes()
+
+
+class ImageEncoder:
+    """Фоновое кодирование обработанных изображений.
+
+    Кодирование (особенно PNG с сжатием) выполняется вне потока интерфейса;
+    результат - Future с байтами, которые забираются при сохранении документа.
+    """
+
+    def __init__(self, params: Optional[Dict[str, List[int]]] = None, workers: int = 1):
+        self.params = params
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, img: np.ndarray, image_format: str, debug_path: Optional[str] = None) -> Future:
+        """Постановка изображения в очередь кодирования"""
+        return self.executor.submit(self._encode, img, image_format, debug_path)
+
+    def _encode(self, img, image_format, debug_path) -> bytes:
+        with tracing.span('encode', format=image_format, width=img.shape[1], height=img.shape[0]) as stage:
+            data = encode_image(img, image_format, self.params)
+            stage.set(bytes=len(data))
+        if debug_path:
+            with open(debug_path, 'wb') as f:
+                f.write(data)
+        return data
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -1,6 +1,21 @@
 import cv2
 import numpy as np
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
+
+from core.color_classifier import ColorClassifier
+from core.region_mask import RegionMask
+from core import tracing
+
+
+# Последнее действие кисти маски в пикселе (0 - кисть не применялась)
+MASK_DRAW = 1
+MASK_ERASE = 2
+
+# Бюджет рабочей памяти обработки полосами по умолчанию (байт)
+DEFAULT_TILE_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# Оценка рабочей памяти на пиксель полосы: HSV, метки цветов, маски регионов и кисти
+TILE_BYTES_PER_PIXEL = 16
 
 
 class ImageProcessor:
@@ -15,133 +30,403 @@ class ImageProcessor:
         self.regions = []
         self.mask_regions = []
 
+        # Кэш классификатора целевых цветов
+        self._color_classifier = None
+
+        # Составная маска регионов и результат замены (обновляются инкрементально)
+        self._composite_image = None
+        self._composite_lists = None
+        self._composite_key = None
+        self._applied_regions = 0
+        self._applied_mask_regions = 0
+        self._regions_union = None
+        self._mask_state = None
+        self._target_mask = None
+        self._result = None
+        self._replaced_count = 0
+
     def load_image(self, image_idx: int) -> np.ndarray:
         """Загрузка изображения по индексу"""
-        image_part = self.document_processor.image_parts[image_idx]
-        image_bytes = image_part.blob
-        image_array = np.frombuffer(image_bytes, np.uint8)
-        self.current_image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        self.current_image = self.document_processor.get_image(image_idx)
         self.current_image_idx = image_idx
         return self.current_image
 
+    def get_color_classifier(self) -> ColorClassifier:
+        """Классификатор целевых цветов (перестраивается только при смене настроек)"""
+        settings = self.document_processor
+        key = ColorClassifier.make_key(settings.target_colors, settings.color_tolerance,
+                                       settings.saturation_threshold, settings.value_threshold)
+        if self._color_classifier is None or self._color_classifier.key != key:
+            self._color_classifier = ColorClassifier(settings.target_colors, settings.color_tolerance,
+                                                     settings.saturation_threshold,
+                                                     settings.value_threshold)
+        return self._color_classifier
+
     def count_color_pixels(self, img: np.ndarray, target_color: Tuple[int, int, int]) -> int:
         """Подсчет пикселей указанного цвета"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-        # Конвертируем целевой цвет в HSV
-        target_bgr = np.uint8([[list(target_color)]])
-        target_hsv = cv2.cvtColor(target_bgr, cv2.COLOR_RGB2HSV)[0][0]
-
-        tolerance = self.document_processor.color_tolerance
-        sat_thresh = self.document_processor.saturation_threshold
-        val_thresh = self.document_processor.value_threshold
-
-        # Создаем маску для цвета
-        lower_color = np.array([
-            max(0, target_hsv[0] - tolerance),
-            sat_thresh,
-            val_thresh
-        ])
-        upper_color = np.array([
-            min(179, target_hsv[0] + tolerance),
-            255,
-            255
-        ])
-
-        color_mask = cv2.inRange(hsv, lower_color, upper_color)
-        return np.sum(color_mask > 0)
+        settings = self.document_processor
+        classifier = ColorClassifier([target_color], settings.color_tolerance,
+                                     settings.saturation_threshold, settings.value_threshold)
+        return classifier.count_pixels(img)[0]
+
+    def count_target_pixels(self, img: np.ndarray) -> List[int]:
+        """Подсчет пикселей каждого из целевых цветов за один проход"""
+        return self.get_color_classifier().count_pixels(img)
+
+    def has_target_colors(self, img: np.ndarray, min_pixels: int = 1) -> bool:
+        """Проверка наличия хотя бы одного из целевых цветов (с ранним выходом)"""
+        return self.get_color_classifier().contains(img, min_pixels)
 
     def process_image_with_regions(self) -> Tuple[np.ndarray, int]:
-        """Обработка изображения с регионами"""
+        """Обработка изображения с регионами.
+
+        Маска замены и результат хранятся между вызовами: новые регионы и маски
+        растеризуются только в своих ограничивающих прямоугольниках, поэтому
+        стоимость обновления зависит от площади изменения, а не от размера
+        изображения и числа регионов.
+        """
         if self.current_image is None:
             return None, 0
 
-        result_img = self.current_image.copy()
-        replacement_mask = np.zeros(result_img.shape[:2], dtype=np.uint8)
+        height, width = self.current_image.shape[:2]
+        with tracing.span('process_image', image=self.current_image_idx, width=width, height=height,
+                          regions=len(self.regions), mask_regions=len(self.mask_regions)) as stage:
+            self._sync_composite()
+            stage.set(pixels_replaced=int(self._replaced_count))
+            return self._result.copy(), self._replaced_count
 
-        # Добавляем регионы в маску
-        for region in self.regions:
-            mask = self._create_region_mask(region)
-            replacement_mask = cv2.bitwise_or(replacement_mask, mask)
+    def process_image_tiled(self, img: np.ndarray,
+                            memory_budget: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """Обработка изображения полосами с ограниченной рабочей памятью.
 
-        # Применяем маски
-        for mask_region in self.mask_regions:
-            mask = self._create_region_mask(mask_region)
-            if mask_region['tool'] == 'draw':
-                replacement_mask = cv2.bitwise_or(replacement_mask, mask)
+        Для очень больших изображений (сканы в сотни мегапикселей): перевод в
+        HSV, составление маски регионов и замена выполняются по
+        горизонтальным полосам, а замена - на месте в img. Прямоугольники
+        накладываются на полосу по координатам, эллипсы, лассо и маски
+        растеризуются один раз в своем ограничивающем прямоугольнике (как в
+        process_image_with_regions) и нарезаются по полосам, поэтому результат
+        совпадает с process_image_with_regions. Кроме самого изображения и
+        растров непрямоугольных регионов память ограничена memory_budget (по
+        умолчанию tile_memory_budget настроек).
+        """
+        if memory_budget is None:
+            memory_budget = getattr(self.document_processor, 'tile_memory_budget', DEFAULT_TILE_MEMORY_BUDGET)
+        if not img.flags.writeable:
+            img = img.copy()
+
+        height, width = img.shape[:2]
+        stripe_rows = max(1, min(height, memory_budget // (max(1, width) * TILE_BYTES_PER_PIXEL)))
+
+        classifier = self.get_color_classifier()
+        replacement_color = list(self.document_processor.replacement_color)[::-1]  # BGR
+        regions = self._tile_stamps(self.regions, (height, width))
+        mask_regions = self._tile_stamps(self.mask_regions, (height, width))
+
+        replaced_count = 0
+        with tracing.span('process_tiled', width=width, height=height, stripe_rows=stripe_rows,
+                          regions=len(regions), mask_regions=len(mask_regions)) as stage:
+            for top in range(0, height, stripe_rows):
+                bottom = min(height, top + stripe_rows)
+                shape = (bottom - top, width)
+
+                union = np.zeros(shape, dtype=np.uint8)
+                for _, part, roi in self._stripe_parts(regions, top, bottom):
+                    if part is None:
+                        union[roi] = 255
+                    else:
+                        np.bitwise_or(union[roi], part, out=union[roi])
+                selected = union > 0
+
+                if mask_regions:
+                    state = np.zeros(shape, dtype=np.uint8)
+                    for mask_region, part, roi in self._stripe_parts(mask_regions, top, bottom):
+                        value = MASK_DRAW if mask_region['tool'] == 'draw' else MASK_ERASE
+                        if part is None:
+                            state[roi] = value
+                        else:
+                            state[roi][part > 0] = value
+                    selected = (state == MASK_DRAW) | ((state == 0) & selected)
+
+                if not selected.any():
+                    # В полосе нет выделения - перевод в HSV не нужен
+                    continue
+
+                stripe = img[top:bottom]
+                replaced = selected & (classifier.match_mask(stripe) > 0)
+                stripe[replaced] = replacement_color
+                replaced_count += int(np.count_nonzero(replaced))
+
+            stage.set(pixels_replaced=replaced_count)
+        return img, replaced_count
+
+    def _tile_stamps(self, regions: List[Dict[str, Any]],
+                     shape: Tuple[int, int]) -> List[Tuple[Dict[str, Any], Any]]:
+        """Регионы для обработки полосами: границы прямоугольника или обрезанная растровая маска"""
+        stamps = []
+        for region in regions:
+            if region['type'] == 'rectangle':
+                bounds = RegionMask.get_bounds(region)
+                left, top = max(0, int(bounds[0])), max(0, int(bounds[1]))
+                right, bottom = min(shape[1], int(bounds[2]) + 1), min(shape[0], int(bounds[3]) + 1)
+                if left < right and top < bottom:
+                    stamps.append((region, (left, top, right, bottom)))
+            else:
+                region_mask = self.get_region_mask(region, shape)
+                if region_mask is not None:
+                    stamps.append((region, region_mask))
+        return stamps
+
+    @staticmethod
+    def _stripe_parts(stamps, top: int, bottom: int):
+        """Части регионов в полосе строк [top, bottom): (регион, маска или None - целиком, срезы в полосе)"""
+        for region, stamp in stamps:
+            if isinstance(stamp, RegionMask):
+                cropped = stamp.crop_rows(top, bottom)
+                if cropped is not None:
+                    yield region, cropped[0], cropped[1]
             else:
-                replacement_mask = cv2.bitwise_and(replacement_mask, cv2.bitwise_not(mask))
-
-        # Находим и заменяем пиксели всех целевых цветов
-        total_replaced = 0
-        for target_color in self.document_processor.target_colors:
-            color_pixels = self._find_color_pixels_in_mask(result_img, replacement_mask, target_color)
-            result_img[color_pixels > 0] = list(self.document_processor.replacement_color)[::-1]  # BGR
-            total_replaced += np.sum(color_pixels > 0)
-
-        return result_img, total_replaced
-
-    def _create_region_mask(self, region: Dict[str, Any]) -> np.ndarray:
-        """Создание маски для региона"""
-        mask = np.zeros(self.current_image.shape[:2], dtype=np.uint8)
-
-        if region['type'] == 'rectangle':
-            x1, y1, x2, y2 = region['x1'], region['y1'], region['x2'], region['y2']
-            cv2.rectangle(mask, (x1, y1), (x2, y2), 255, -1)
-
-        elif region['type'] == 'ellipse':
-            x1, y1, x2, y2 = region['x1'], region['y1'], region['x2'], region['y2']
-            center_x = (x1 + x2) // 2
-            center_y = (y1 + y2) // 2
-            width = abs(x2 - x1)
-            height = abs(y2 - y1)
-
-            if width > 0 and height > 0:
-                cv2.ellipse(mask, (center_x, center_y), (width // 2, height // 2),
-                            0, 0, 360, 255, -1)
-
-        elif region['type'] == 'lasso' or region['type'] == 'mask':
-            points = np.array(region['points'], dtype=np.int32)
-            if len(points) >= 3:
-                cv2.fillPoly(mask, [points], 255)
-
-        return mask
-
-    def _find_color_pixels_in_mask(self, img: np.ndarray, mask: np.ndarray,
-                                   target_color: Tuple[int, int, int]) -> np.ndarray:
-        """Находит пиксели указанного цвета в маске"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-        # Конвертируем целевой цвет в HSV
-        target_bgr = np.uint8([[list(target_color)]])
-        target_hsv = cv2.cvtColor(target_bgr, cv2.COLOR_RGB2HSV)[0][0]
-
-        tolerance = self.document_processor.color_tolerance
-        sat_thresh = self.document_processor.saturation_threshold
-        val_thresh = self.document_processor.value_threshold
-
-        lower_color = np.array([
-            max(0, target_hsv[0] - tolerance),
-            sat_thresh,
-            val_thresh
-        ])
-        upper_color = np.array([
-            min(179, target_hsv[0] + tolerance),
-            255,
-            255
-        ])
-
-        color_mask = cv2.inRange(hsv, lower_color, upper_color)
+                left, rect_top, right, rect_bottom = stamp
+                start, end = max(rect_top, top), min(rect_bottom, bottom)
+                if start < end:
+                    yield region, None, (slice(start - top, end - top), slice(left, right))
+
+    def _sync_composite(self):
+        """Приведение составной маски и результата в соответствие с регионами"""
+        image = self.current_image
+        if (self._composite_image is not image or
+                self._composite_lists[0] is not self.regions or
+                self._composite_lists[1] is not self.mask_regions or
+                self._applied_regions > len(self.regions) or
+                self._applied_mask_regions > len(self.mask_regions)):
+            # Новое изображение или списки регионов заменены (например, отменой) - строим заново
+            self._rebuild_composite()
+            return
+
+        classifier = self.get_color_classifier()
+        replacement_color = tuple(self.document_processor.replacement_color)
+        if self._composite_key != (classifier.key, replacement_color):
+            # Изменились настройки цветов - растеризация регионов не нужна
+            self._update_target_mask()
+            self._refresh_roi(None)
+
+        # Регионы и маски только добавлялись - применяем новые
+        added = (len(self.regions) - self._applied_regions +
+                 len(self.mask_regions) - self._applied_mask_regions)
+        if added:
+            with tracing.span('composite', mode='incremental', added=added):
+                for region in self.regions[self._applied_regions:]:
+                    self._apply_region(region, None)
+                for mask_region in self.mask_regions[self._applied_mask_regions:]:
+                    self._apply_region(mask_region, mask_region['tool'])
+        self._applied_regions = len(self.regions)
+        self._applied_mask_regions = len(self.mask_regions)
+
+    def _rebuild_composite(self):
+        """Полное построение составной маски по всем регионам"""
+        with tracing.span('composite', mode='rebuild', regions=len(self.regions),
+                          mask_regions=len(self.mask_regions)):
+            shape = self.current_image.shape[:2]
+            self._composite_image = self.current_image
+            self._composite_lists = (self.regions, self.mask_regions)
+
+            # Объединение регионов (0/255) и последнее действие кисти маски по пикселю:
+            # 0 - не было, MASK_DRAW - добавлено, MASK_ERASE - стерто
+            self._regions_union = np.zeros(shape, dtype=np.uint8)
+            self._mask_state = np.zeros(shape, dtype=np.uint8)
+
+            for region in self.regions:
+                self._apply_region(region, None, refresh=False)
+            for mask_region in self.mask_regions:
+                self._apply_region(mask_region, mask_region['tool'], refresh=False)
+            self._applied_regions = len(self.regions)
+            self._applied_mask_regions = len(self.mask_regions)
+
+            self._update_target_mask()
+            self._result = self.current_image.copy()
+            self._replaced_count = 0
+            self._refresh_roi(None)
+
+    def _update_target_mask(self):
+        """Кэш маски пикселей целевых цветов для текущего изображения"""
+        classifier = self.get_color_classifier()
+        self._target_mask = self._find_target_pixels_in_mask(self.current_image, None) > 0
+        self._composite_key = (classifier.key, tuple(self.document_processor.replacement_color))
+
+    def _apply_region(self, region: Dict[str, Any], tool: Optional[str], refresh: bool = True):
+        """Добавление региона (tool=None) или маски в составную маску"""
+        region_mask = self.get_region_mask(region)
+        if region_mask is None:
+            return
+
+        old_replaced = self._replaced_in_roi(region_mask.roi) if refresh else None
+        self._stamp_region(region_mask, tool, region_mask)
+        if refresh:
+            self._refresh_roi(region_mask.roi, old_replaced)
+
+    def _stamp_region(self, region_mask: RegionMask, tool: Optional[str], area: RegionMask):
+        """Нанесение региона или маски на составную маску в пределах прямоугольника area"""
+        cropped = region_mask.crop_to(area)
+        if cropped is None:
+            return
+
+        part, roi = cropped
+        if tool is None:
+            union = self._regions_union[roi]
+            np.bitwise_or(union, part, out=union)
+        else:
+            self._mask_state[roi][part > 0] = MASK_DRAW if tool == 'draw' else MASK_ERASE
+
+    def _restamp_area(self, area: RegionMask):
+        """Пересборка составной маски внутри прямоугольника по всем регионам и маскам"""
+        self._regions_union[area.roi] = 0
+        self._mask_state[area.roi] = 0
+        for region in self.regions:
+            region_mask = self.get_region_mask(region)
+            if region_mask is not None:
+                self._stamp_region(region_mask, None, area)
+        for mask_region in self.mask_regions:
+            region_mask = self.get_region_mask(mask_region)
+            if region_mask is not None:
+                self._stamp_region(region_mask, mask_region['tool'], area)
+
+    def _replaced_in_roi(self, roi) -> np.ndarray:
+        """Заменяемые пиксели в области: маска регионов с учетом кисти и целевых цветов"""
+        state = self._mask_state[roi]
+        selected = (state == MASK_DRAW) | ((state == 0) & (self._regions_union[roi] > 0))
+        return selected & self._target_mask[roi]
+
+    def _refresh_roi(self, roi, old_replaced: Optional[np.ndarray] = None):
+        """Пересчет результата в области (None - все изображение)"""
+        if roi is None:
+            roi = (slice(None), slice(None))
+            old_count = self._replaced_count
+        else:
+            old_count = np.count_nonzero(old_replaced) if old_replaced is not None else 0
+
+        with tracing.span('replace') as stage:
+            replaced = self._replaced_in_roi(roi)
+            result = self._result[roi]
+            np.copyto(result, self.current_image[roi])
+            result[replaced] = list(self.document_processor.replacement_color)[::-1]  # BGR
+            replaced_count = np.count_nonzero(replaced)
+            self._replaced_count += replaced_count - old_count
+            stage.set(pixels=result.shape[0] * result.shape[1], replaced=int(replaced_count))
+
+    def get_change_mask(self) -> Optional[RegionMask]:
+        """Маска замененных пикселей текущего результата, обрезанная по изменениям"""
+        if self.current_image is None:
+            return None
+
+        self._sync_composite()
+        replaced = self._replaced_in_roi((slice(None), slice(None))).view(np.uint8) * np.uint8(255)
+        x, y, w, h = cv2.boundingRect(replaced)
+        if w == 0 or h == 0:
+            return None
+        return RegionMask(replaced[y:y + h, x:x + w].copy(), x, y, replaced.shape)
+
+    def get_region_mask(self, region: Dict[str, Any],
+                        shape: Optional[Tuple[int, int]] = None) -> Optional[RegionMask]:
+        """Обрезанная маска региона (растеризуется один раз и хранится в регионе)"""
+        if shape is None:
+            shape = self.current_image.shape[:2]
+        region_mask = region.get('raster')
+        if region_mask is None or region_mask.image_shape != shape:
+            region_mask = RegionMask.from_region(region, shape)
+            region['raster'] = region_mask
+        return region_mask
+
+    def _find_target_pixels_in_mask(self, img: np.ndarray, mask: Optional[np.ndarray]) -> np.ndarray:
+        """Находит пиксели любого из целевых цветов в маске (None - во всем изображении)"""
+        color_mask = self.get_color_classifier().match_mask(img)
+        if mask is None:
+            return color_mask
         return cv2.bitwise_and(color_mask, color_mask, mask=mask)
 
     def add_region(self, region: Dict[str, Any]):
         """Добавление региона"""
+        if self.current_image is not None:
+            # Растеризуем сразу, чтобы маска попала и в историю действий
+            self.get_region_mask(region)
         self.regions.append(region)
 
     def add_mask_region(self, mask_region: Dict[str, Any]):
         """Добавление маски"""
+        if self.current_image is not None:
+            self.get_region_mask(mask_region)
         self.mask_regions.append(mask_region)
 
+    def insert_region(self, kind: str, index: int, region: Dict[str, Any]):
+        """Вставка региона (kind='regions') или маски (kind='mask_regions') по индексу"""
+        regions = self.regions if kind == 'regions' else self.mask_regions
+        if index >= len(regions):
+            # Добавление в конец применяется при следующей обработке
+            if kind == 'regions':
+                self.add_region(region)
+            else:
+                self.add_mask_region(region)
+            return
+
+        self._change_regions(region, lambda: regions.insert(index, region))
+
+    def remove_region(self, kind: str, index: int) -> Dict[str, Any]:
+        """Удаление региона или маски по индексу"""
+        regions = self.regions if kind == 'regions' else self.mask_regions
+        region = regions[index]
+        self._change_regions(region, lambda: regions.pop(index))
+        return region
+
+    def apply_operation(self, operation: Dict[str, Any]):
+        """Применение действия журнала истории (добавление или удаление)"""
+        if operation['action'] == 'add':
+            self.insert_region(operation['kind'], operation['index'], operation['region'])
+        else:
+            self.remove_region(operation['kind'], operation['index'])
+
+    def _change_regions(self, region: Dict[str, Any], change):
+        """Изменение списка регионов с пересчетом составной маски только в области региона"""
+        if self.current_image is None:
+            change()
+            return
+
+        self._sync_composite()
+        region_mask = self.get_region_mask(region)
+        old_replaced = self._replaced_in_roi(region_mask.roi) if region_mask is not None else None
+
+        change()
+        self._applied_regions = len(self.regions)
+        self._applied_mask_regions = len(self.mask_regions)
+
+        if region_mask is not None:
+            with tracing.span('composite', mode='change', width=region_mask.width, height=region_mask.height):
+                self._restamp_area(region_mask)
+                self._refresh_roi(region_mask.roi, old_replaced)
+
+    def set_regions(self, regions: List[Dict[str, Any]], mask_regions: List[Dict[str, Any]]):
+        """Приведение регионов и масок к заданным спискам (например, к снимку из другого потока).
+
+        Добавление в конец, а также вставка или удаление одного элемента (как
+        при отмене и повторе) пересчитывают составную маску только в области
+        региона; прочие изменения приводят к полному построению.
+        """
+        for kind, target in (('regions', regions), ('mask_regions', mask_regions)):
+            current = self.regions if kind == 'regions' else self.mask_regions
+            index = next((i for i, (old, new) in enumerate(zip(current, target)) if old is not new),
+                         min(len(current), len(target)))
+
+            if index == len(current):
+                for region in target[index:]:
+                    self.insert_region(kind, len(current), region)
+            elif (len(target) == len(current) + 1 and
+                  all(old is new for old, new in zip(current[index:], target[index + 1:]))):
+                self.insert_region(kind, index, target[index])
+            elif (len(current) == len(target) + 1 and
+                  all(old is new for old, new in zip(current[index + 1:], target[index:]))):
+                self.remove_region(kind, index)
+            elif kind == 'regions':
+                self.regions = list(target)
+            else:
+                self.mask_regions = list(target)
+
     def clear_regions(self):
         """Очистка всех регионов и масок"""
         self.regions.clear()
@@ -0,0 +1,350 @@
+import re
+import hashlib
+import posixpath
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Optional, Callable, Iterable, List, Tuple, Any
+from xml.etree import ElementTree
+
+import cv2
+import numpy as np
+from lxml import etree
+
+from core import tracing
+
+
+# Бюджет кэша декодированных изображений по умолчанию (байт)
+DEFAULT_IMAGE_CACHE_BUDGET = 512 * 1024 * 1024
+
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+IMAGE_RELTYPE_SUFFIX = '/image'
+
+# Основная часть документа в архиве DOCX
+MAIN_DOCUMENT_PART = 'word/document.xml'
+
+# Виды частей-источников изображений (по имени части) в порядке обхода
+PART_KINDS = [
+    ('document', re.compile(r'^document\.xml$')),
+    ('header', re.compile(r'^header\d*\.xml$')),
+    ('footer', re.compile(r'^footer\d*\.xml$')),
+    ('footnotes', re.compile(r'^footnotes\.xml$')),
+    ('endnotes', re.compile(r'^endnotes\.xml$')),
+    ('comments', re.compile(r'^comments\w*\.xml$')),
+]
+OTHER_PART_KIND = 'other'
+
+# Элементы разметки частей, важные для порядка изображений
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+BLIP_TAG = '{http://schemas.openxmlformats.org/drawingml/2006/main}blip'
+IMAGEDATA_TAG = '{urn:schemas-microsoft-com:vml}imagedata'
+FALLBACK_TAG = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+PARAGRAPH_TAG = f'{{{W_NS}}}p'
+BREAK_TAG = f'{{{W_NS}}}br'
+RENDERED_BREAK_TAG = f'{{{W_NS}}}lastRenderedPageBreak'
+SECTION_TAG = f'{{{W_NS}}}sectPr'
+SECTION_TYPE_TAG = f'{{{W_NS}}}type'
+EMBED_ATTR = f'{{{R_NS}}}embed'
+ID_ATTR = f'{{{R_NS}}}id'
+TYPE_ATTR = f'{{{W_NS}}}type'
+VAL_ATTR = f'{{{W_NS}}}val'
+REFERENCE_TAGS = (BLIP_TAG, IMAGEDATA_TAG, PARAGRAPH_TAG, BREAK_TAG, RENDERED_BREAK_TAG, SECTION_TAG)
+
+# Через сколько абзацев удалять из дерева уже разобранные элементы
+PARAGRAPH_BATCH = 1024
+
+# Разрывы секций, не начинающие новую страницу
+CONTINUOUS_SECTIONS = ('continuous', 'nextColumn')
+
+
+def rels_path_for_part(part_name: str) -> str:
+    """Путь к файлу связей части: word/document.xml -> word/_rels/document.xml.rels"""
+    directory, name = posixpath.split(part_name)
+    return posixpath.join(directory, '_rels', f"{name}.rels")
+
+
+def part_for_rels_path(rels_name: str) -> Optional[str]:
+    """Часть, которой принадлежит файл связей (None - связи самого пакета)"""
+    directory, name = posixpath.split(rels_name)
+    if posixpath.basename(directory) != '_rels' or not name.endswith('.rels'):
+        return None
+    part_name = posixpath.join(posixpath.dirname(directory), name[:-len('.rels')])
+    return part_name if posixpath.basename(part_name) else None
+
+
+def get_part_kind(part_name: str) -> str:
+    """Вид части: основной текст, колонтитул, сноски, примечания и т.п."""
+    name = posixpath.basename(part_name)
+    for kind, pattern in PART_KINDS:
+        if pattern.match(name):
+            return kind
+    return OTHER_PART_KIND
+
+
+def iter_image_references(stream) -> Iterable[Tuple[str, int, int]]:
+    """Ссылки на изображения в XML части в порядке чтения.
+
+    Часть разбирается потоково (iterparse), обработанные абзацы сразу
+    удаляются из дерева, поэтому память не зависит от размера документа.
+    Для каждой ссылки (a:blip r:embed или v:imagedata r:id) выдается
+    (rId, число отрисованных Word разрывов страниц перед ней, число явных
+    разрывов страниц и секций перед ней). Ссылки из mc:Fallback пропускаются:
+    это запасная копия того же рисунка для старых версий Word.
+    """
+    rendered_breaks = 0
+    explicit_breaks = 0
+    paragraphs = 0
+
+    for _, elem in etree.iterparse(stream, events=('end',), tag=REFERENCE_TAGS, huge_tree=True):
+        tag = elem.tag
+        if tag == BLIP_TAG or tag == IMAGEDATA_TAG:
+            rel_id = elem.get(EMBED_ATTR) if tag == BLIP_TAG else elem.get(ID_ATTR)
+            if rel_id and next(elem.iterancestors(FALLBACK_TAG), None) is None:
+                yield rel_id, rendered_breaks, explicit_breaks
+        elif tag == RENDERED_BREAK_TAG:
+            rendered_breaks += 1
+        elif tag == BREAK_TAG:
+            if elem.get(TYPE_ATTR) == 'page':
+                explicit_breaks += 1
+        elif tag == SECTION_TAG:
+            section_type = elem.find(SECTION_TYPE_TAG)
+            if section_type is None or section_type.get(VAL_ATTR) not in CONTINUOUS_SECTIONS:
+                explicit_breaks += 1
+        elif tag == PARAGRAPH_TAG:
+            # Абзац обработан полностью: освобождаем его содержимое, а пустые
+            # предыдущие элементы удаляем пачками
+            elem.clear()
+            paragraphs += 1
+            if paragraphs % PARAGRAPH_BATCH == 0:
+                parent = elem.getparent()
+                if parent is not None:
+                    del parent[:parent.index(elem)]
+
+
+def resolve_target(part_name: str, target: str) -> str:
+    """Имя элемента архива, на который указывает связь части part_name"""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+
+
+class MediaEntry:
+    """Изображение в архиве документа; байты читаются только по запросу.
+
+    names - все элементы архива с тем же содержимым (первый - name): они
+    обрабатываются один раз, а результат записывается во все.
+    """
+
+    def __init__(self, store: 'MediaStore', name: str):
+        self.store = store
+        self.name = name
+        self.names = [name]
+
+    @property
+    def blob(self) -> bytes:
+        return self.store.read(self.name)
+
+    @property
+    def size(self) -> int:
+        return self.store.get_info(self.name).file_size
+
+    def __repr__(self):
+        return f"MediaEntry({self.name!r})"
+
+
+class MediaStore:
+    """Ленивый доступ к изображениям DOCX.
+
+    При открытии читается только каталог архива и файлы связей. Байты
+    изображений читаются из архива по требованию, декодированные массивы
+    хранятся в LRU-кэше, ограниченном по суммарному размеру.
+    """
+
+    def __init__(self, docx_path: str, cache_budget: int = DEFAULT_IMAGE_CACHE_BUDGET):
+        self.docx_path = docx_path
+        self.cache_budget = cache_budget
+        self.archive = zipfile.ZipFile(docx_path)
+        self.entries = {info.filename: info for info in self.archive.infolist()}
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        # Поколение содержимого элемента: растет при каждой инвалидации, чтобы
+        # декодирование, начатое до замены изображения, не вернуло в кэш старые пиксели
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Закрытие архива и очистка кэша"""
+        self.clear_cache()
+        self.archive.close()
+
+    def get_entry(self, name: str) -> MediaEntry:
+        """Элемент архива с изображением"""
+        return MediaEntry(self, name)
+
+    def get_info(self, name: str) -> zipfile.ZipInfo:
+        return self.entries[name]
+
+    def read(self, name: str) -> bytes:
+        """Чтение байтов элемента архива"""
+        return self.archive.read(name)
+
+    def get_unique_entries(self, names: Iterable[str]) -> List[MediaEntry]:
+        """Элементы архива без повторов содержимого, в порядке первого упоминания.
+
+        Кандидаты в дубликаты отбираются по CRC и размеру из каталога архива
+        (без чтения данных), совпадение подтверждается хэшем содержимого.
+        """
+        unique_entries = []
+        by_signature = {}  # (CRC, размер) -> элементы с такой сигнатурой
+        seen = set()
+        hashes = {}
+
+        def get_hash(name):
+            if name not in hashes:
+                hashes[name] = hashlib.sha1(self.read(name)).digest()
+            return hashes[name]
+
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+
+            info = self.entries[name]
+            candidates = by_signature.setdefault((info.CRC, info.file_size), [])
+            for entry in candidates:
+                if get_hash(entry.name) == get_hash(name):
+                    entry.names.append(name)
+                    break
+            else:
+                entry = MediaEntry(self, name)
+                candidates.append(entry)
+                unique_entries.append(entry)
+
+        return unique_entries
+
+    def read_header(self, name: str, size: int) -> bytes:
+        """Первые байты элемента (без распаковки всего содержимого)"""
+        with self.archive.open(name) as f:
+            return f.read(size)
+
+    def get_image_relationships(self, part_name: str) -> Dict[str, str]:
+        """Связи части с изображениями: rId -> имя элемента архива"""
+        rels_name = rels_path_for_part(part_name)
+        if rels_name not in self.entries:
+            return {}
+
+        relationships = {}
+        root = ElementTree.fromstring(self.read(rels_name))
+        for rel in root.iter(f"{{{RELATIONSHIPS_NS}}}Relationship"):
+            if not rel.get('Type', '').endswith(IMAGE_RELTYPE_SUFFIX):
+                continue
+            # Внешние изображения (ссылки) в архиве отсутствуют
+            if rel.get('TargetMode') == 'External':
+                continue
+            target = resolve_target(part_name, rel.get('Target', ''))
+            if target in self.entries:
+                relationships[rel.get('Id')] = target
+        return relationships
+
+    def get_media_index(self, main_part: str = MAIN_DOCUMENT_PART) -> Dict[str, List[Dict[str, Any]]]:
+        """Изображения всех частей пакета в порядке чтения: имя элемента -> ссылки на него.
+
+        Обходятся связи всех частей (основной текст, колонтитулы, сноски,
+        примечания, диаграммы и т.д.): сначала main_part, затем остальные по
+        виду части и имени. Внутри части порядок - порядок ссылок в ее XML.
+        Ссылка - словарь: part (часть-источник), rel_id, order (номер ссылки
+        в пакете) и page (примерная страница, только для main_part). Связи,
+        на которые нет ссылок в разметке, тоже попадают в индекс (с order и
+        page = None), чтобы при сохранении их содержимое заменялось вместе
+        с остальными.
+        """
+        kind_order = {kind: i for i, (kind, _) in enumerate(PART_KINDS)}
+        parts = [part_for_rels_path(name) for name in self.entries if name.endswith('.rels')]
+        parts = sorted((part for part in parts if part),
+                       key=lambda part: (part != main_part,
+                                         kind_order.get(get_part_kind(part), len(kind_order)), part))
+
+        media_index = {}
+        order = 0
+        for part_name in parts:
+            relationships = self.get_image_relationships(part_name)
+            if not relationships:
+                continue
+
+            references = []
+            if part_name in self.entries:
+                with self.archive.open(part_name) as stream:
+                    references = [reference for reference in iter_image_references(stream)
+                                  if reference[0] in relationships]
+
+            # Номер страницы: по разрывам, отрисованным Word, а если их нет - по явным
+            use_rendered = any(rendered for _, rendered, _ in references)
+            for rel_id, rendered, explicit in references:
+                page = None
+                if part_name == main_part:
+                    page = 1 + (rendered if use_rendered else explicit)
+                media_index.setdefault(relationships[rel_id], []).append(
+                    {'part': part_name, 'rel_id': rel_id, 'order': order, 'page': page})
+                order += 1
+
+            referenced = {rel_id for rel_id, _, _ in references}
+            for rel_id, target in relationships.items():
+                if rel_id not in referenced:
+                    media_index.setdefault(target, []).append(
+                        {'part': part_name, 'rel_id': rel_id, 'order': None, 'page': None})
+        return media_index
+
+    def get_image(self, name: str, loader: Optional[Callable[[], bytes]] = None,
+                  flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """Декодированное изображение из кэша (или декодирование и добавление в кэш).
+
+        Возвращаемый массив только для чтения: он может использоваться
+        одновременно несколькими потребителями.
+        """
+        key = (name, flags)
+        with self._lock:
+            img = self._cache.get(key)
+            if img is not None:
+                self._cache.move_to_end(key)
+                return img
+            generation = self._generations.get(name, 0)
+
+        image_bytes = loader() if loader is not None else self.read(name)
+        with tracing.span('decode', part=name, bytes=len(image_bytes)) as stage:
+            img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+            if img is None:
+                return None
+            stage.set(width=img.shape[1], height=img.shape[0])
+        img.flags.writeable = False
+
+        with self._lock:
+            if (key not in self._cache and img.nbytes <= self.cache_budget and
+                    self._generations.get(name, 0) == generation):
+                self._cache[key] = img
+                self._cache_bytes += img.nbytes
+                self._evict()
+        return img
+
+    def invalidate(self, name: str):
+        """Удаление из кэша всех декодированных вариантов элемента"""
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            for key in [key for key in self._cache if key[0] == name]:
+                self._cache_bytes -= self._cache.pop(key).nbytes
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    @property
+    def cache_bytes(self) -> int:
+        return self._cache_bytes
+
+    def _evict(self):
+        """Вытеснение давно использованных изображений сверх бюджета"""
+        while self._cache_bytes > self.cache_budget and self._cache:
+            _, img = self._cache.popitem(last=False)
+            self._cache_bytes -= img.nbytes
@@ -0,0 +1,172 @@
+import cv2
+import numpy as np
+from typing import Dict, Any, Optional, Tuple, Sequence
+
+# Допуск упрощения контуров лассо и масок по умолчанию (пиксели изображения)
+DEFAULT_STROKE_TOLERANCE = 1.0
+
+
+def simplify_points(points: Sequence, tolerance: float = DEFAULT_STROKE_TOLERANCE) -> np.ndarray:
+    """Упрощение замкнутого контура алгоритмом Рамера-Дугласа-Пекера.
+
+    Точки, отклоняющиеся от упрощенного контура не больше чем на tolerance
+    пикселей, отбрасываются (при tolerance <= 0 - только подряд идущие
+    повторы). Результат - компактный массив int32 формы (N, 2) только для
+    чтения: его могут использовать одновременно регион и история действий.
+    """
+    points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+    if len(points) > 1:
+        # Несколько событий мыши подряд в одном пикселе изображения
+        moved = np.any(points[1:] != points[:-1], axis=1)
+        points = points[np.concatenate(([True], moved))]
+    if tolerance > 0 and len(points) > 3:
+        points = cv2.approxPolyDP(points.reshape(-1, 1, 2), tolerance, True).reshape(-1, 2)
+
+    points = np.ascontiguousarray(points)
+    points.flags.writeable = False
+    return points
+
+
+class RegionMask:
+    """Маска региона, обрезанная по его ограничивающему прямоугольнику.
+
+    Хранит только пиксели прямоугольника (0/255) и смещение его левого
+    верхнего угла в изображении. Массив только для чтения, поэтому одна
+    маска может использоваться и регионом, и историей действий.
+    """
+
+    def __init__(self, mask: np.ndarray, x: int, y: int, image_shape: Tuple[int, int]):
+        mask.flags.writeable = False
+        self.mask = mask
+        self.x = x
+        self.y = y
+        self.image_shape = image_shape
+
+    @property
+    def width(self) -> int:
+        return self.mask.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.mask.shape[0]
+
+    @property
+    def roi(self) -> Tuple[slice, slice]:
+        """Срезы прямоугольника маски в массиве изображения"""
+        return slice(self.y, self.y + self.height), slice(self.x, self.x + self.width)
+
+    @property
+    def nbytes(self) -> int:
+        return self.mask.nbytes
+
+    def crop_to(self, other: 'RegionMask') -> Optional[Tuple[np.ndarray, Tuple[slice, slice]]]:
+        """Часть маски внутри прямоугольника other и ее срезы в изображении"""
+        left, top = max(self.x, other.x), max(self.y, other.y)
+        right = min(self.x + self.width, other.x + other.width)
+        bottom = min(self.y + self.height, other.y + other.height)
+        if left >= right or top >= bottom:
+            return None
+
+        part = self.mask[top - self.y:bottom - self.y, left - self.x:right - self.x]
+        return part, (slice(top, bottom), slice(left, right))
+
+    def crop_rows(self, top: int, bottom: int) -> Optional[Tuple[np.ndarray, Tuple[slice, slice]]]:
+        """Часть маски в строках [top, bottom) изображения и ее срезы в полосе этих строк"""
+        start, end = max(self.y, top), min(self.y + self.height, bottom)
+        if start >= end:
+            return None
+        return (self.mask[start - self.y:end - self.y],
+                (slice(start - top, end - top), slice(self.x, self.x + self.width)))
+
+    def to_full(self) -> np.ndarray:
+        """Маска размером с изображение"""
+        full = np.zeros(self.image_shape, dtype=np.uint8)
+        full[self.roi] = self.mask
+        return full
+
+    @staticmethod
+    def get_bounds(region: Dict[str, Any]) -> Optional[Tuple[int, int, int, int]]:
+        """Ограничивающий прямоугольник региона (left, top, right, bottom включительно).
+
+        Для пустого или неизвестного региона возвращается None.
+        """
+        if region['type'] in ('rectangle', 'ellipse'):
+            x1, y1, x2, y2 = region['x1'], region['y1'], region['x2'], region['y2']
+            if region['type'] == 'rectangle':
+                return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+            center_x, center_y, axes = RegionMask._ellipse_geometry(region)
+            if axes is None:
+                return None
+            return center_x - axes[0], center_y - axes[1], center_x + axes[0], center_y + axes[1]
+
+        if region['type'] == 'lasso' or region['type'] == 'mask':
+            points = np.asarray(region['points'], dtype=np.int32)
+            if len(points) < 3:
+                return None
+            return (*(int(v) for v in points.min(axis=0)), *(int(v) for v in points.max(axis=0)))
+
+        return None
+
+    @staticmethod
+    def _ellipse_geometry(region: Dict[str, Any]):
+        """Центр и полуоси эллипса (полуоси None для вырожденного эллипса)"""
+        x1, y1, x2, y2 = region['x1'], region['y1'], region['x2'], region['y2']
+        width = abs(x2 - x1)
+        height = abs(y2 - y1)
+        if width == 0 or height == 0:
+            return None, None, None
+        return (x1 + x2) // 2, (y1 + y2) // 2, (width // 2, height // 2)
+
+    @staticmethod
+    def draw(region: Dict[str, Any], canvas: np.ndarray, left: int, top: int):
+        """Рисование региона (255) на холсте, левый верхний угол которого - (left, top) в изображении.
+
+        Контуры эллипсов и многоугольников OpenCV обрезает по границам холста и
+        растеризует обрезанную фигуру иначе, поэтому совпадение с растеризацией
+        всего изображения гарантируется, только если холст вмещает весь
+        регион в пределах изображения (как в from_region).
+        """
+        if region['type'] == 'rectangle':
+            cv2.rectangle(canvas, (region['x1'] - left, region['y1'] - top),
+                          (region['x2'] - left, region['y2'] - top), 255, -1)
+        elif region['type'] == 'ellipse':
+            center_x, center_y, axes = RegionMask._ellipse_geometry(region)
+            if axes is not None:
+                cv2.ellipse(canvas, (center_x - left, center_y - top), axes, 0, 0, 360, 255, -1)
+        else:
+            points = np.asarray(region['points'], dtype=np.int32)
+            cv2.fillPoly(canvas, [points], 255, offset=(-left, -top))
+
+    @staticmethod
+    def scale(region: Dict[str, Any], scale_x: float, scale_y: float) -> Dict[str, Any]:
+        """Копия региона в другом масштабе (без растровой маски)"""
+        scaled = {key: value for key, value in region.items() if key != 'raster'}
+        if region['type'] in ('rectangle', 'ellipse'):
+            for key, factor in (('x1', scale_x), ('y1', scale_y), ('x2', scale_x), ('y2', scale_y)):
+                scaled[key] = int(region[key] * factor)
+        else:
+            points = np.asarray(region['points'], dtype=np.float64).reshape(-1, 2) * (scale_x, scale_y)
+            scaled['points'] = points.astype(np.int32)
+        return scaled
+
+    @staticmethod
+    def from_region(region: Dict[str, Any], image_shape: Tuple[int, int]) -> Optional['RegionMask']:
+        """Растеризация региона в его ограничивающем прямоугольнике.
+
+        Прямоугольник обрезается по границам изображения; для пустого
+        региона возвращается None.
+        """
+        bounds = RegionMask.get_bounds(region)
+        if bounds is None:
+            return None
+
+        img_h, img_w = image_shape
+        left, top = max(0, int(bounds[0])), max(0, int(bounds[1]))
+        right, bottom = min(img_w - 1, int(bounds[2])), min(img_h - 1, int(bounds[3]))
+        if left > right or top > bottom:
+            return None
+
+        mask = np.zeros((bottom - top + 1, right - left + 1), dtype=np.uint8)
+        RegionMask.draw(region, mask, left, top)
+        return RegionMask(mask, left, top, (img_h, img_w))
@@ -0,0 +1,109 @@
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, Optional, Callable
+
+import cv2
+import numpy as np
+
+
+# Папки отчета по умолчанию
+COMPARISON_FOLDER = "comparison_results"
+NO_COLOR_FOLDER = "check_no_color_images"
+
+# Максимальная сторона миниатюры в режиме "только миниатюры"
+THUMBNAIL_SIZE = 400
+
+
+def make_comparison(orig_img: np.ndarray, proc_img: np.ndarray,
+                    thumbnail_size: Optional[int] = None) -> np.ndarray:
+    """Оригинал и результат рядом (при thumbnail_size - уменьшенные)"""
+    height = max(orig_img.shape[0], proc_img.shape[0])
+    width = max(orig_img.shape[1], proc_img.shape[1])
+
+    if thumbnail_size:
+        scale = min(1.0, thumbnail_size / max(height, width))
+        height, width = max(1, int(height * scale)), max(1, int(width * scale))
+
+    # Приводим изображения к одинаковому размеру перед объединением
+    if orig_img.shape[:2] != (height, width):
+        orig_img = cv2.resize(orig_img, (width, height), interpolation=cv2.INTER_AREA)
+    if proc_img.shape[:2] != (height, width):
+        proc_img = cv2.resize(proc_img, (width, height), interpolation=cv2.INTER_AREA)
+    return np.hstack([orig_img, proc_img])
+
+
+def apply_change_masks(orig_img: np.ndarray, layers) -> np.ndarray:
+    """Результат обработки по исходному изображению и слоям (маска замен, цвет RGB)"""
+    proc_img = orig_img.copy()
+    for change_mask, color in layers:
+        roi = proc_img[change_mask.roi]
+        roi[change_mask.mask > 0] = color[::-1]  # BGR
+    return proc_img
+
+
+def write_report(docx_path: str,
+                 changed: List[Tuple[int, str, List[Tuple[Any, Tuple[int, int, int]]]]],
+                 untouched: List[Tuple[int, str]],
+                 output_folder: str = COMPARISON_FOLDER,
+                 no_color_folder: str = NO_COLOR_FOLDER,
+                 thumbnail_size: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 cancelled: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """Запись отчета об обработке.
+
+    changed - измененные изображения: (индекс, имя элемента архива, слои
+    замен из DocumentProcessor.change_masks); для них пишутся сравнения
+    "до/после" в пуле потоков. Результат не декодируется: он восстанавливается
+    по исходному изображению и маскам, поэтому на изображение приходится одно
+    декодирование. untouched - изображения без целевых цветов: (индекс, имя
+    элемента); они копируются из архива как есть, без декодирования.
+    Документ открывается заново, поэтому отчет не зависит от состояния
+    DocumentProcessor и может строиться в фоне.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    summary = {'comparisons': [], 'untouched': 0, 'errors': []}
+
+    with zipfile.ZipFile(docx_path) as archive:
+        def write_comparison(job):
+            image_idx, name, layers = job
+            if cancelled and cancelled():
+                return None
+            orig_img = cv2.imdecode(np.frombuffer(archive.read(name), np.uint8), cv2.IMREAD_COLOR)
+            if orig_img is None:
+                raise ValueError(f"не удалось декодировать изображение {image_idx + 1}")
+            proc_img = apply_change_masks(orig_img, layers)
+
+            comparison = make_comparison(orig_img, proc_img, thumbnail_size)
+            comp_path = os.path.join(output_folder, f"comparison_{image_idx + 1:03d}.png")
+            success, buffer = cv2.imencode('.png', comparison)
+            if not success:
+                raise ValueError(f"не удалось закодировать сравнение {image_idx + 1}")
+            buffer.tofile(comp_path)
+            return image_idx + 1
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(write_comparison, job) for job in changed]
+
+            # Изображения без целевых цветов - побайтовая копия из архива
+            if untouched:
+                os.makedirs(no_color_folder, exist_ok=True)
+            for i, (image_idx, name) in enumerate(untouched):
+                if cancelled and cancelled():
+                    break
+                extension = posixpath.splitext(name)[1] or '.png'
+                with open(os.path.join(no_color_folder, f"no_color_{i + 1:03d}{extension}"), 'wb') as f:
+                    f.write(archive.read(name))
+                summary['untouched'] += 1
+
+            for (image_idx, name, _), future in zip(changed, futures):
+                try:
+                    number = future.result()
+                    if number is not None:
+                        summary['comparisons'].append(number)
+                except Exception as e:
+                    summary['errors'].append(f"Ошибка при создании сравнения для изображения {image_idx + 1}: {e}")
+
+    summary['comparisons'].sort()
+    return summary
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+from typing import List, Dict, Any, Optional
+
+
+# Переменная окружения: путь к файлу трассировки (включает трассировку при запуске)
+TRACE_ENV = 'COLOR_REDACT_TRACE'
+
+
+class Span:
+    """Замер одного этапа: время и атрибуты (размер изображения, число регионов и т.п.)"""
+
+    __slots__ = ('tracer', 'name', 'attributes', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = 0
+
+    def set(self, **attributes):
+        """Добавление атрибутов, известных только после выполнения этапа"""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.start, end, self.attributes)
+        return False
+
+
+class _NoopSpan:
+    """Замер при выключенной трассировке: ничего не записывает"""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Сборщик замеров этапов обработки.
+
+    По умолчанию выключен: span() возвращает пустой замер, и накладные
+    расходы сводятся к одному вызову. Во включенном состоянии события
+    хранятся сразу в формате Chrome trace (ph='X', время в микросекундах от
+    эпохи), поэтому события из процессов пакетного режима можно объединять.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        # Привязка монотонного счетчика к настенному времени
+        self._wall_origin_us = time.time_ns() // 1000
+        self._perf_origin_ns = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name: str, **attributes) -> Span:
+        """Замер этапа для использования в with"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def record(self, name: str, start_ns: int, end_ns: int, attributes: Dict[str, Any]):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': self._wall_origin_us + (start_ns - self._perf_origin_ns) / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': attributes,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Накопленные события с очисткой (для передачи из процесса-воркера)"""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def add_events(self, events: List[Dict[str, Any]]):
+        """Добавление событий, собранных в другом процессе"""
+        with self._lock:
+            self.events.extend(events)
+
+    def export_chrome_trace(self, path: str):
+        """Запись событий в формате Chrome trace (chrome://tracing, Perfetto)"""
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                      ensure_ascii=False, default=str)
+
+    def get_summary(self) -> List[Dict[str, Any]]:
+        """Сводка по этапам: число вызовов, суммарное, среднее и максимальное время (мс)"""
+        stages = {}
+        with self._lock:
+            for event in self.events:
+                stage = stages.setdefault(event['name'], {'name': event['name'], 'count': 0,
+                                                          'total_ms': 0.0, 'max_ms': 0.0})
+                duration = event['dur'] / 1000
+                stage['count'] += 1
+                stage['total_ms'] += duration
+                stage['max_ms'] = max(stage['max_ms'], duration)
+
+        summary = sorted(stages.values(), key=lambda stage: stage['total_ms'], reverse=True)
+        for stage in summary:
+            stage['mean_ms'] = stage['total_ms'] / stage['count']
+        return summary
+
+    def format_summary(self) -> str:
+        """Сводка по этапам в виде текстовой таблицы"""
+        lines = [f"{'Этап':24s} {'Вызовов':>8s} {'Всего, мс':>12s} {'Среднее, мс':>12s} {'Макс, мс':>12s}"]
+        for stage in self.get_summary():
+            lines.append(f"{stage['name']:24s} {stage['count']:8d} {stage['total_ms']:12.1f} "
+                         f"{stage['mean_ms']:12.2f} {stage['max_ms']:12.2f}")
+        return '\n'.join(lines)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, **attributes) -> Span:
+    """Замер этапа глобальным сборщиком: with span('decode', bytes=n) as s: ..."""
+    return _tracer.span(name, **attributes)
+
+
+def is_enabled() -> bool:
+    return _tracer.enabled
+
+
+def start_tracing(path: Optional[str] = None):
+    """Включение трассировки; при указанном path трасса и сводка выводятся при выходе.
+
+    В процессах-воркерах файл не пишется: их события забирает основной процесс.
+    """
+    _tracer.enable()
+    if path and multiprocessing.parent_process() is None:
+        atexit.register(finish_tracing, path)
+
+
+def finish_tracing(path: str):
+    """Запись трассы в файл и вывод сводки по этапам"""
+    try:
+        _tracer.export_chrome_trace(path)
+        print(_tracer.format_summary())
+        print(f"Трассировка сохранена: {path}")
+    except Exception as e:
+        print(f"Ошибка при сохранении трассировки: {e}")
+
+
+if os.environ.get(TRACE_ENV):
+    start_tracing(os.environ[TRACE_ENV])
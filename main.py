@@ -1,15 +1,27 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
-
-from ui.main_window import RedShapeEditor
+import argparse
+import multiprocessing
 
 
 def main():
+    # Пакетный режим без интерфейса: python main.py batch <папка>
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_main(sys.argv[2:]))
+
+    from PyQt5.QtWidgets import QApplication
+    from ui.main_window import RedShapeEditor
+    from core.tracing import start_tracing
+
+    trace_path = get_trace_path(sys.argv[1:])
+    if trace_path:
+        start_tracing(trace_path)
+
     app = QApplication(sys.argv)
 
     # Создаем главное окно
     editor = RedShapeEditor()
+    editor.document_processor.debug_dir = get_debug_dir(sys.argv[1:])
     editor.show()
 
     # Автоматически ищем документ или предлагаем выбрать
@@ -28,6 +40,90 @@ def main():
     sys.exit(app.exec_())
 
 
+def get_debug_dir(argv):
+    """Папка отладочного вывода из аргумента --debug-images DIR (или None)"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--debug-images", metavar="DIR")
+    args, _ = parser.parse_known_args(argv)
+    return args.debug_images
+
+
+def get_trace_path(argv):
+    """Файл трассировки из аргумента --trace FILE (или None)"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--trace", metavar="FILE")
+    args, _ = parser.parse_known_args(argv)
+    return args.trace
+
+
+def parse_color(value):
+    """Разбор цвета вида R,G,B"""
+    try:
+        color = tuple(int(part) for part in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверный цвет: {value} (ожидается R,G,B)")
+    if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+        raise argparse.ArgumentTypeError(f"Неверный цвет: {value} (ожидается R,G,B)")
+    return color
+
+
+def batch_main(argv):
+    """Пакетная обработка папки с DOCX файлами"""
+    from core.batch_processor import run_batch, MODE_WHOLE_IMAGE, MODE_REGIONS
+    from core.tracing import start_tracing, is_enabled as is_tracing_enabled
+
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Замена целевых цветов во всех изображениях DOCX файлов папки")
+    parser.add_argument("input_dir", help="Папка с DOCX файлами (обходится рекурсивно)")
+    parser.add_argument("--regions", metavar="JSON",
+                        help="Файл с сохраненными регионами; без него заменяется все изображение")
+    parser.add_argument("--output-dir", help="Папка для результатов (по умолчанию - рядом с исходными)")
+    parser.add_argument("--summary", default="batch_summary.json",
+                        help="Файл JSON со сводкой (по умолчанию batch_summary.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--target-color", type=parse_color, action="append", metavar="R,G,B",
+                        help="Целевой цвет (можно указать несколько раз)")
+    parser.add_argument("--replacement-color", type=parse_color, default=(0, 0, 255), metavar="R,G,B",
+                        help="Цвет замены")
+    parser.add_argument("--tolerance", type=int, default=20, help="Допуск тона")
+    parser.add_argument("--saturation", type=int, default=100, help="Порог насыщенности")
+    parser.add_argument("--value", type=int, default=100, help="Порог яркости")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Не использовать постоянный кэш результатов обнаружения")
+    parser.add_argument("--debug-images", metavar="DIR",
+                        help="Сохранять обработанные изображения в папку (для отладки)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Записать трассировку этапов в формате Chrome trace (JSON)")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        start_tracing(args.trace)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Папка не найдена: {args.input_dir}")
+
+    settings = {
+        'target_colors': args.target_color or [(236, 19, 27)],
+        'replacement_color': args.replacement_color,
+        'color_tolerance': args.tolerance,
+        'saturation_threshold': args.saturation,
+        'value_threshold': args.value,
+        'use_detection_cache': not args.no_cache,
+        'debug_dir': args.debug_images,
+        'trace': is_tracing_enabled(),
+    }
+
+    summary = run_batch(args.input_dir, settings,
+                        mode=MODE_REGIONS if args.regions else MODE_WHOLE_IMAGE,
+                        regions_path=args.regions,
+                        output_dir=args.output_dir,
+                        summary_path=args.summary,
+                        workers=args.workers)
+
+    return 1 if summary['totals']['documents_failed'] else 0
+
+
 def find_docx_file():
     """Поиск DOCX файла"""
     # Сначала ищем test.docx
@@ -44,4 +140,6 @@ def find_docx_file():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Необходимо для пула процессов сканирования в собранном EXE
+    multiprocessing.freeze_support()
+    main()
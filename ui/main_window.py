@@ -1,15 +1,46 @@
 import os
 import cv2
 import numpy as np
-from PyQt5.QtWidgets import (QMainWindow, QMessageBox, QFileDialog, QToolBar, QAction)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QColor
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QMessageBox, QFileDialog, QToolBar, QAction)
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QPixmap, QImage, QPen, QColor, QPolygon
 
 from core.document_processor import DocumentProcessor
 from core.image_processor import ImageProcessor
 from core.history_manager import HistoryManager
 from ui.widgets import RedShapeEditorUI
 from ui.color_picker import ColorPickerDialog
+from ui.workers import ScanWorker, ImagePrefetcher, ReportWorker, AutoPreviewWorker
+from core.report_writer import COMPARISON_FOLDER, NO_COLOR_FOLDER, THUMBNAIL_SIZE
+from core.display_pyramid import DisplayPyramid, render_for_display
+from core.region_mask import simplify_points
+from core import tracing
+
+# Таблица подсветки измененных пикселей: смешивание с зеленым (30% зеленого).
+# Одинакова для порядка каналов BGR и RGB
+HIGHLIGHT_LUT = np.array([[[int(v * 0.7), int(v * 0.7 + 255 * 0.3), int(v * 0.7)]
+                           for v in range(256)]], dtype=np.uint8)
+
+# Грубый предпросмотр в разрешении показа считается, если изображение больше
+# области показа хотя бы во столько раз по площади
+LOW_RES_PREVIEW_MIN_RATIO = 4
+
+# Подписи частей документа, в которых находится изображение (кроме основного текста)
+PART_KIND_TITLES = {
+    'header': 'верхний колонтитул',
+    'footer': 'нижний колонтитул',
+    'footnotes': 'сноски',
+    'endnotes': 'концевые сноски',
+    'comments': 'примечания',
+    'other': 'другая часть документа',
+}
+
+
+def bgr_to_pixmap(img: np.ndarray) -> QPixmap:
+    """QPixmap из изображения BGR (Qt показывает BGR напрямую, конвертация не нужна)"""
+    h, w = img.shape[:2]
+    q_img = QImage(img.data, w, h, img.strides[0], QImage.Format_BGR888)
+    return QPixmap.fromImage(q_img)
 
 
 class RedShapeEditor(QMainWindow):
@@ -29,6 +60,8 @@ class RedShapeEditor(QMainWindow):
         self.auto_preview = True
         self.preview_mode = False
         self.preview_image = None
+        self.auto_preview_cache = None  # (предпросмотр, размер показа, QPixmap с подсветкой)
+        self.display_pyramid = None  # уменьшенные копии текущего изображения для показа
 
         # Для рисования
         self.current_pixmap = None
@@ -46,6 +79,25 @@ class RedShapeEditor(QMainWindow):
         # Текущий индекс
         self.current_index = 0
 
+        # Фоновое сканирование документа
+        self.scan_worker = None
+        self.waiting_for_scan = False
+        self.current_color_pixels = None
+
+        # Фоновая подготовка следующих изображений
+        self.prefetcher = ImagePrefetcher(self.document_processor, self.image_processor)
+
+        # Фоновая запись отчета после сохранения
+        self.report_worker = None
+
+        # Фоновый расчет автопредпросмотра (показывается только последний запрос)
+        self.preview_worker = AutoPreviewWorker(self.document_processor)
+        self.preview_worker.preview_ready.connect(self.on_auto_preview_ready)
+        self.preview_worker.preview_failed.connect(self.on_auto_preview_failed)
+        if QApplication.instance() is not None:
+            # Поток ожидает запросов постоянно - останавливаем его и при выходе без закрытия окна
+            QApplication.instance().aboutToQuit.connect(self.preview_worker.stop)
+
     def setup_toolbar(self):
         """Настройка панели инструментов"""
         toolbar = QToolBar("Основные инструменты")
@@ -129,11 +181,102 @@ class RedShapeEditor(QMainWindow):
 
     def load_word_document(self, docx_path: str) -> bool:
         """Загрузка Word документа"""
+        self.stop_scan()
+        self.prefetcher.clear()
+
         if not self.document_processor.load_document(docx_path):
             return False
 
-        # Фильтруем изображения с целевыми цветами
-        self.document_processor.filter_images_with_red(self.image_processor)
+        self.document_processor.filtered_indices = []
+        self.current_index = 0
+        self.image_processor.current_image = None
+        self.image_processor.clear_regions()
+        self.current_pixmap = None
+        self.ui.image_label.clear()
+        self.update_color_info()
+
+        # Фильтруем изображения с целевыми цветами в фоне,
+        # первое найденное изображение открывается сразу
+        self.start_scan()
+        return True
+
+    def start_scan(self):
+        """Запуск фонового сканирования изображений"""
+        self.waiting_for_scan = False
+        self.ui.progress_label.setText("Поиск изображений с целевыми цветами...")
+        self.ui.progress_bar.setMaximum(len(self.document_processor.image_parts))
+        self.ui.progress_bar.setValue(0)
+
+        self.scan_worker = ScanWorker(self.document_processor, self.image_processor, self)
+        self.scan_worker.image_scanned.connect(self.on_image_scanned)
+        self.scan_worker.scan_failed.connect(self.on_scan_failed)
+        self.scan_worker.finished.connect(self.on_scan_finished)
+        self.scan_worker.start()
+
+    def stop_scan(self):
+        """Остановка фонового сканирования"""
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+            self.scan_worker.wait()
+            self.scan_worker = None
+
+    def restart_scan(self):
+        """Перезапуск идущего сканирования после смены настроек обнаружения.
+
+        Уже показанные изображения остаются в очереди, остальные найденные
+        отбрасываются - они отобраны по прежним цветам - и документ
+        сканируется заново.
+        """
+        if not self.is_scanning():
+            return
+        self.stop_scan()
+        del self.document_processor.filtered_indices[self.current_index + 1:]
+
+        waiting = self.waiting_for_scan
+        self.start_scan()
+        self.waiting_for_scan = waiting
+
+    def is_scanning(self) -> bool:
+        """Идет ли фоновое сканирование"""
+        return self.scan_worker is not None and self.scan_worker.isRunning()
+
+    def on_image_scanned(self, image_idx, has_target_color, scanned, total):
+        """Результат сканирования очередного изображения"""
+        if self.sender() is not self.scan_worker:
+            return
+
+        # После перезапуска сканирования уже показанные изображения не добавляются повторно
+        if has_target_color and image_idx in self.document_processor.filtered_indices:
+            has_target_color = False
+
+        if has_target_color:
+            self.document_processor.filtered_indices.append(image_idx)
+
+            # Первое найденное изображение (или ожидание после последнего) - открываем
+            if self.image_processor.current_image is None or self.waiting_for_scan:
+                self.waiting_for_scan = False
+                self.load_current_image()
+                return
+
+        if self.image_processor.current_image is None or self.waiting_for_scan:
+            self.ui.progress_label.setText(f"Поиск изображений с целевыми цветами: {scanned}/{total}")
+            self.ui.progress_bar.setMaximum(total)
+            self.ui.progress_bar.setValue(scanned)
+        else:
+            self.update_progress()
+            if has_target_color:
+                self.schedule_prefetch()
+
+    def on_scan_failed(self, message):
+        """Ошибка фонового сканирования"""
+        print(f"Ошибка сканирования: {message}")
+
+    def on_scan_finished(self):
+        """Завершение фонового сканирования"""
+        if self.sender() is not self.scan_worker:
+            return
+
+        print(f"Изображения с целевыми цветами в порядке документа: {self.document_processor.filtered_indices}")
 
         if not self.document_processor.filtered_indices:
             QMessageBox.information(self, "Информация",
@@ -141,68 +284,90 @@ class RedShapeEditor(QMainWindow):
                                     "Вы можете продолжить работу и добавить цвета вручную.")
             # Создаем пустой список для работы
             self.document_processor.filtered_indices = list(range(len(self.document_processor.image_parts)))
-
-        self.current_index = 0
-        self.load_current_image()
-        self.update_color_info()
-        return True
+            self.current_index = 0
+            self.load_current_image()
+        elif self.waiting_for_scan:
+            self.waiting_for_scan = False
+            self.load_current_image()
+        else:
+            self.update_progress()
 
     def load_current_image(self):
         """Загрузка текущего изображения"""
         if self.current_index >= len(self.document_processor.filtered_indices):
+            if self.is_scanning():
+                # Сканирование еще идет - ждем следующего найденного изображения
+                self.waiting_for_scan = True
+                self.ui.progress_label.setText("Поиск следующего изображения с целевыми цветами...")
+                return
             self.finish_processing()
             return
 
         # Очищаем регионы и сбрасываем предпросмотр
+        self.preview_worker.cancel()
         self.image_processor.clear_regions()
         self.history_manager.clear()
         self.preview_image = None
         self.preview_mode = False
+        self.current_color_pixels = None
 
         self.ui.btn_preview.setText("👁 Предпросмотр")
         self.ui.btn_preview.setStyleSheet(
             "QPushButton { background-color: #a9e34b; color: black; font-weight: bold; }")
 
-        # Загружаем изображение
+        # Загружаем изображение (если оно подготовлено заранее - из кэша)
         image_idx = self.document_processor.filtered_indices[self.current_index]
+        prefetched = self.prefetcher.take(image_idx, self.display_target_size())
         self.image_processor.load_image(image_idx)
+        self.display_pyramid = None
+        if prefetched is not None:
+            self.current_color_pixels = prefetched.color_pixels
+            self.display_pyramid = prefetched.display_pyramid
 
-        # Сохраняем оригинал
-        if len(self.document_processor.original_paths) <= self.current_index:
-            orig_path = self.document_processor.save_original_image(self.current_index, image_idx)
-            self.document_processor.original_paths.append(orig_path)
+        # Первое посещение: по умолчанию изображение считается пропущенным
+        if len(self.document_processor.processed_images) <= self.current_index:
+            self.document_processor.processed_images.append(None)
 
-            if len(self.document_processor.processed_paths) <= self.current_index:
-                self.document_processor.processed_paths.append(orig_path)
+            # Оригинал сохраняется на диск только в режиме отладки
+            if not (prefetched is not None and prefetched.original_path and prefetched.index == self.current_index):
+                self.document_processor.save_original_image(self.current_index, image_idx)
 
         # Отображаем изображение
-        self.display_image()
+        self.display_image(prefetched.display_image if prefetched is not None else None)
         self.update_progress()
 
-        # Добавляем начальное состояние в историю
-        self.history_manager.add_state([], [])
+        # Готовим соседние изображения в фоне
+        self.schedule_prefetch()
+
+    def display_target_size(self):
+        """Размер, до которого масштабируется изображение при показе"""
+        return self.ui.image_label.width() - 20, self.ui.image_label.height() - 20
 
-    def display_image(self):
+    def get_display_pyramid(self) -> DisplayPyramid:
+        """Пирамида уменьшенных копий текущего изображения (строится один раз)"""
+        image = self.image_processor.current_image
+        if self.display_pyramid is None or self.display_pyramid.image is not image:
+            self.display_pyramid = DisplayPyramid(image)
+        return self.display_pyramid
+
+    def schedule_prefetch(self):
+        """Фоновая подготовка следующих (и предыдущего) изображений"""
+        if self.image_processor.current_image is not None:
+            self.prefetcher.schedule(self.current_index, self.display_target_size())
+
+    def display_image(self, prepared_image=None):
         """Отображение изображения на метке с УВЕЛИЧЕННЫМ РАЗМЕРОМ"""
         if self.image_processor.current_image is None:
             return
 
-        # Конвертируем BGR в RGB
-        img_rgb = cv2.cvtColor(self.image_processor.current_image, cv2.COLOR_BGR2RGB)
-        h, w, ch = img_rgb.shape
-        bytes_per_line = ch * w
-
-        # Создаем QImage
-        q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_img)
-
-        # Масштабируем для отображения с УВЕЛИЧЕННЫМ РАЗМЕРОМ
-        scaled_pixmap = pixmap.scaled(
-            self.ui.image_label.width() - 20,
-            self.ui.image_label.height() - 20,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
+        if prepared_image is not None:
+            # Изображение уже уменьшено в фоне
+            self.current_pixmap = QPixmap.fromImage(prepared_image)
+            self.ui.image_label.setPixmap(self.current_pixmap)
+            return
+
+        # Уменьшенная копия из пирамиды: полное разрешение не конвертируется и не масштабируется
+        scaled_pixmap = bgr_to_pixmap(self.get_display_pyramid().render(self.display_target_size()))
 
         self.current_pixmap = scaled_pixmap
         self.ui.image_label.setPixmap(scaled_pixmap)
@@ -213,21 +378,32 @@ class RedShapeEditor(QMainWindow):
             return
 
         total_red = len(self.document_processor.filtered_indices)
-        current_color_pixels = 0
 
-        if self.image_processor.current_image is not None:
-            # Считаем пиксели всех целевых цветов
-            for target_color in self.document_processor.target_colors:
-                current_color_pixels += self.image_processor.count_color_pixels(
-                    self.image_processor.current_image, target_color)
+        if self.current_color_pixels is None and self.image_processor.current_image is not None:
+            # Считаем пиксели всех целевых цветов (один раз на изображение)
+            self.current_color_pixels = sum(self.document_processor.count_target_pixels(
+                self.image_processor.current_image_idx, self.image_processor))
+        current_color_pixels = self.current_color_pixels or 0
 
         # Показываем порядковый номер в документе
         image_idx = self.document_processor.filtered_indices[self.current_index]
         total_images = len(self.document_processor.image_parts)
 
+        # Примерная страница; изображения из колонтитулов, сносок и т.п. помечаем частью документа
+        kinds = []
+        page = self.document_processor.get_image_page(image_idx)
+        if page is not None:
+            kinds.append(f"стр. ~{page}")
+        for source in self.document_processor.get_image_sources(image_idx):
+            title = PART_KIND_TITLES.get(source['kind'])
+            if title and title not in kinds:
+                kinds.append(title)
+        part_suffix = f", {', '.join(kinds)}" if kinds else ""
+
+        scan_suffix = " (поиск продолжается...)" if self.is_scanning() else ""
         self.ui.progress_label.setText(
             f"Изображение {self.current_index + 1}/{total_red} "
-            f"(в документе: №{image_idx + 1} из {total_images})"
+            f"(в документе: №{image_idx + 1} из {total_images}{part_suffix}){scan_suffix}"
         )
 
         # Сбрасываем стиль метки цветных пикселей
@@ -247,9 +423,14 @@ class RedShapeEditor(QMainWindow):
         """Выбор целевого цвета"""
         dialog = ColorPickerDialog(self.document_processor.target_colors, self)
         if dialog.exec_():
-            new_colors = dialog.get_colors()
-            self.document_processor.target_colors = new_colors
-            self.update_color_info()
+            self.set_target_colors(dialog.get_colors())
+
+    def set_target_colors(self, colors):
+        """Смена целевых цветов (идущее сканирование перезапускается с новыми цветами)"""
+        self.document_processor.target_colors = colors
+        self.update_color_info()
+        self.prefetcher.clear()
+        self.restart_scan()
 
     def choose_replacement_color(self):
         """Выбор цвета замены"""
@@ -264,9 +445,7 @@ class RedShapeEditor(QMainWindow):
         """Управление цветами"""
         dialog = ColorPickerDialog(self.document_processor.target_colors, self)
         if dialog.exec_():
-            new_colors = dialog.get_colors()
-            self.document_processor.target_colors = new_colors
-            self.update_color_info()
+            self.set_target_colors(dialog.get_colors())
 
     def change_mode(self, button):
         """Смена режима выделения"""
@@ -292,6 +471,8 @@ class RedShapeEditor(QMainWindow):
         self.auto_preview = enabled
         if enabled and self.image_processor.get_region_count() > 0:
             self.create_auto_preview()
+        elif not enabled:
+            self.preview_worker.cancel()
 
     def toggle_preview(self):
         """Переключение режима предпросмотра"""
@@ -320,12 +501,14 @@ class RedShapeEditor(QMainWindow):
 
     def create_preview(self):
         """Создание предпросмотра с изменениями"""
+        # Запоздавший автопредпросмотр не должен заменить этот
+        self.preview_worker.cancel()
         try:
             # Обрабатываем изображение для предпросмотра
             preview_img, replaced_count = self.image_processor.process_image_with_regions()
 
-            # Сохраняем для отображения
-            self.preview_image = preview_img.copy()
+            # Сохраняем для отображения (возвращается новый массив - копия не нужна)
+            self.preview_image = preview_img
 
             # Отображаем предпросмотр
             self.display_preview_image(preview_img)
@@ -338,18 +521,9 @@ class RedShapeEditor(QMainWindow):
 
     def display_preview_image(self, img):
         """Отображение изображения предпросмотра"""
-        # Конвертируем BGR в RGB
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        h, w, ch = img_rgb.shape
-        bytes_per_line = ch * w
-
-        # Создаем QImage
-        q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_img)
-
-        # Масштабируем для отображения
-        scaled_pixmap = pixmap.scaled(self.ui.image_label.width(), self.ui.image_label.height(),
-                                      Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        # Уменьшаем до размера метки до перевода в QPixmap
+        scaled_pixmap = bgr_to_pixmap(
+            render_for_display(img, (self.ui.image_label.width(), self.ui.image_label.height())))
 
         self.ui.image_label.setPixmap(scaled_pixmap)
 
@@ -368,28 +542,45 @@ class RedShapeEditor(QMainWindow):
         self.ui.red_pixels_label.setStyleSheet("color: #51cf66; font-weight: bold;")
 
     def create_auto_preview(self):
-        """Создание автоматического предпросмотра"""
+        """Запуск автоматического предпросмотра в фоне (устаревшие запросы отбрасываются)"""
         # Защита от рекурсии при обновлении предпросмотра
         if self.history_manager.adding_to_history:
             return
 
-        try:
-            # Обрабатываем изображение для предпросмотра
-            preview_img, replaced_count = self.image_processor.process_image_with_regions()
+        image = self.image_processor.current_image
+        if image is None:
+            return
 
-            # Сохраняем для отображения
-            self.preview_image = preview_img.copy()
+        # Для большого изображения сначала показывается грубый предпросмотр в разрешении показа
+        display_image = None
+        display_size = self.display_target_size()
+        if image.shape[0] * image.shape[1] >= LOW_RES_PREVIEW_MIN_RATIO * display_size[0] * display_size[1]:
+            display_image = self.get_display_pyramid().render(display_size)
 
-            # Отображаем предпросмотр с подсветкой
-            self.display_auto_preview(preview_img)
+        self.preview_worker.request(image, self.image_processor.regions,
+                                    self.image_processor.mask_regions, display_image)
 
-            # Показываем статистику
-            self.show_auto_preview_stats(replaced_count)
+    def on_auto_preview_ready(self, generation, preview_img, replaced_count, full_resolution):
+        """Результат фонового предпросмотра (показывается, только если он последний)"""
+        if not self.preview_worker.is_current(generation) or self.image_processor.current_image is None:
+            return
 
-        except Exception as e:
-            print(f"Ошибка автопредпросмотра: {e}")
-            # Показываем обычное изображение с контурами в случае ошибки
-            self.redraw_all_shapes()
+        if full_resolution:
+            # Сохраняем для отображения (возвращается новый массив - копия не нужна)
+            self.preview_image = preview_img
+
+        # Отображаем предпросмотр с подсветкой
+        self.display_auto_preview(preview_img)
+
+        # Показываем статистику
+        self.show_auto_preview_stats(replaced_count, approximate=not full_resolution)
+
+    def on_auto_preview_failed(self, generation, message):
+        if not self.preview_worker.is_current(generation):
+            return
+        print(f"Ошибка автопредпросмотра: {message}")
+        # Показываем обычное изображение с контурами в случае ошибки
+        self.redraw_all_shapes()
 
     def display_auto_preview(self, img):
         """Отображение автоматического предпросмотра с подсветкой изменений"""
@@ -397,46 +588,41 @@ class RedShapeEditor(QMainWindow):
             return
 
         try:
-            # Находим разницу между оригиналом и предпросмотром
-            diff = cv2.absdiff(self.image_processor.current_image, img)
-            gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-
-            # Создаем маску измененных областей
-            change_mask = gray_diff > 10
-
-            # Создаем копию изображения для подсветки
-            highlighted_img = img.copy()
-
-            # ПРАВИЛЬНОЕ индексирование для подсветки измененных областей
-            # Получаем координаты измененных пикселей
-            changed_coords = np.where(change_mask)
-
-            if len(changed_coords[0]) > 0:
-                # Подсвечиваем измененные области зеленым (более мягко)
-                for i in range(len(changed_coords[0])):
-                    y, x = changed_coords[0][i], changed_coords[1][i]
-                    # Смешиваем с зеленым цветом (30% зеленого)
-                    highlighted_img[y, x, 0] = int(highlighted_img[y, x, 0] * 0.7)  # B
-                    highlighted_img[y, x, 1] = int(highlighted_img[y, x, 1] * 0.7 + 255 * 0.3)  # G
-                    highlighted_img[y, x, 2] = int(highlighted_img[y, x, 2] * 0.7)  # R
-
-            # Конвертируем для отображения
-            img_rgb = cv2.cvtColor(highlighted_img, cv2.COLOR_BGR2RGB)
-            h, w, ch = img_rgb.shape
-            bytes_per_line = ch * w
-
-            # Создаем QImage
-            q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
-
-            # Масштабируем для отображения (С УВЕЛИЧЕННЫМ РАЗМЕРОМ)
-            scaled_pixmap = pixmap.scaled(
-                self.ui.image_label.width() - 20,
-                self.ui.image_label.height() - 20,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-
+            display_size = self.display_target_size()
+
+            # Подсветка для этого состояния предпросмотра уже построена
+            if self.auto_preview_cache is not None:
+                cached_img, cached_size, cached_pixmap = self.auto_preview_cache
+                if cached_img is img and cached_size == display_size:
+                    self.ui.image_label.setPixmap(cached_pixmap)
+                    return
+
+            with tracing.span('auto_preview', width=img.shape[1], height=img.shape[0]):
+                # Подсветка строится в разрешении показа: оригинал берется из пирамиды,
+                # предпросмотр уменьшается тем же способом, поэтому неизмененные
+                # участки совпадают точно
+                original = self.get_display_pyramid().render(display_size)
+                img_bgr = render_for_display(img, display_size).copy()
+
+                # Находим разницу между оригиналом и предпросмотром
+                diff = cv2.absdiff(original, img_bgr)
+                gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+
+                # Маска измененных областей (после уменьшения изменение усредняется, поэтому
+                # учитывается любая разница)
+                change_mask = cv2.threshold(gray_diff, 0, 255, cv2.THRESH_BINARY)[1]
+
+                # Подсвечиваем измененные области зеленым (30% зеленого): смешивание по
+                # таблице внутри ограничивающего прямоугольника изменений, копирование по маске
+                x, y, w, h = cv2.boundingRect(change_mask)
+                if w > 0 and h > 0:
+                    roi = img_bgr[y:y + h, x:x + w]
+                    blended = cv2.LUT(roi, HIGHLIGHT_LUT)
+                    cv2.copyTo(blended, change_mask[y:y + h, x:x + w], roi)
+
+            scaled_pixmap = bgr_to_pixmap(img_bgr)
+
+            self.auto_preview_cache = (img, display_size, scaled_pixmap)
             self.ui.image_label.setPixmap(scaled_pixmap)
 
         except Exception as e:
@@ -447,31 +633,16 @@ class RedShapeEditor(QMainWindow):
     def display_preview_fallback(self, img):
         """Резервный метод отображения предпросмотра"""
         try:
-            # Конвертируем BGR в RGB
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            h, w, ch = img_rgb.shape
-            bytes_per_line = ch * w
-
-            # Создаем QImage
-            q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
-
-            # Масштабируем для отображения
-            scaled_pixmap = pixmap.scaled(
-                self.ui.image_label.width() - 20,
-                self.ui.image_label.height() - 20,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            scaled_pixmap = bgr_to_pixmap(render_for_display(img, self.display_target_size()))
 
             self.ui.image_label.setPixmap(scaled_pixmap)
         except Exception as e:
             print(f"Ошибка в резервном отображении: {e}")
 
-    def show_auto_preview_stats(self, replaced_count):
-        """Показать статистику автопредпросмотра"""
+    def show_auto_preview_stats(self, replaced_count, approximate=False):
+        """Показать статистику автопредпросмотра (approximate - оценка по грубому предпросмотру)"""
         self.ui.red_pixels_label.setText(
-            f"🟢 Будет заменено: {replaced_count} пикселей"
+            f"🟢 Будет заменено: {'≈' if approximate else ''}{replaced_count} пикселей"
         )
         self.ui.red_pixels_label.setStyleSheet(
             "color: #51cf66; font-weight: bold; background-color: #f8f9fa; padding: 5px;")
@@ -507,6 +678,8 @@ class RedShapeEditor(QMainWindow):
                 self.current_points = [(x, y)]
             elif self.mode == "lasso" or self.mode == "mask":
                 self.current_points = [(x, y)]
+                self.ui.image_label.clear_temp_shape()
+                self.ui.image_label.add_temp_point(x, y)
 
     def on_mouse_move(self, event):
         """Движение мыши с зажатой кнопкой"""
@@ -525,6 +698,9 @@ class RedShapeEditor(QMainWindow):
         # РАЗРЕШАЕМ ДВИЖЕНИЕ ЗА ПРЕДЕЛАМИ ИЗОБРАЖЕНИЯ
         # Не проверяем границы при движении - позволяем рисовать где угодно
         if self.mode == "lasso" or self.mode == "mask":
+            # Повторные события в той же точке не добавляют вершин
+            if self.current_points and self.current_points[-1] == (x, y):
+                return
             self.current_points.append((x, y))
             self.draw_temp_shape()
         elif self.mode == "rectangle":
@@ -563,78 +739,41 @@ class RedShapeEditor(QMainWindow):
 
         self.last_point = None
         self.start_point = None
+        self.ui.image_label.clear_temp_shape()
 
         # АВТОМАТИЧЕСКИЙ ПРЕДПРОСМОТР после добавления области
         if self.auto_preview and self.image_processor.get_region_count() > 0:
             self.create_auto_preview()
+        else:
+            # Без предпросмотра добавленная фигура остается видна контуром
+            self.redraw_all_shapes()
 
     def draw_temp_shape(self):
-        """Рисование временной фигуры"""
+        """Рисование временной фигуры (слой поверх изображения дополняется последним отрезком)"""
         if not self.current_points:
             return
 
-        pixmap = self.current_pixmap.copy()
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(QColor(255, 255, 0), 2))
-
-        if len(self.current_points) > 1:
-            for i in range(len(self.current_points) - 1):
-                x1, y1 = self.current_points[i]
-                x2, y2 = self.current_points[i + 1]
-                painter.drawLine(int(x1), int(y1), int(x2), int(y2))
-
-        painter.end()
-        self.ui.image_label.setPixmap(pixmap)
+        x, y = self.current_points[-1]
+        self.ui.image_label.add_temp_point(x, y)
 
     def draw_temp_rectangle(self, x, y):
         """Рисование временного прямоугольника"""
         if self.start_point is None:
             return
 
-        pixmap = self.current_pixmap.copy()
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(QColor(255, 255, 0), 2))
-
-        x1, y1 = self.start_point
-        x2, y2 = x, y
-
         # Рисуем прямоугольник от начальной точки до текущей
         # Ограничиваем отрисовку размерами pixmap, но координаты могут быть за пределами
-        draw_x1 = max(0, min(x1, x2))
-        draw_y1 = max(0, min(y1, y2))
-        draw_x2 = min(pixmap.width(), max(x1, x2))
-        draw_y2 = min(pixmap.height(), max(y1, y2))
-
-        painter.drawRect(int(draw_x1), int(draw_y1),
-                         int(draw_x2 - draw_x1), int(draw_y2 - draw_y1))
-
-        painter.end()
-        self.ui.image_label.setPixmap(pixmap)
+        x1, y1 = self.start_point
+        self.ui.image_label.set_temp_shape('rect', self.ui.image_label.clamped_rect(x1, y1, x, y))
 
     def draw_temp_ellipse(self, x, y):
         """Рисование временного эллипса"""
         if self.start_point is None:
             return
 
-        pixmap = self.current_pixmap.copy()
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(QColor(255, 255, 0), 2))
-
-        x1, y1 = self.start_point
-        x2, y2 = x, y
-
-        # Ограничиваем отрисовку размерами pixmap
-        draw_x1 = max(0, min(x1, x2))
-        draw_y1 = max(0, min(y1, y2))
-        draw_x2 = min(pixmap.width(), max(x1, x2))
-        draw_y2 = min(pixmap.height(), max(y1, y2))
-
         # Рисуем эллипс в ограничивающем прямоугольнике
-        painter.drawEllipse(int(draw_x1), int(draw_y1),
-                            int(draw_x2 - draw_x1), int(draw_y2 - draw_y1))
-
-        painter.end()
-        self.ui.image_label.setPixmap(pixmap)
+        x1, y1 = self.start_point
+        self.ui.image_label.set_temp_shape('ellipse', self.ui.image_label.clamped_rect(x1, y1, x, y))
 
     def finalize_rectangle(self, x, y):
         """Финализация прямоугольника"""
@@ -657,7 +796,7 @@ class RedShapeEditor(QMainWindow):
         self.image_processor.add_region(region)
 
         # Добавляем в историю
-        self.history_manager.add_state(self.image_processor.regions, self.image_processor.mask_regions)
+        self.history_manager.record_add('regions', region)
 
         # Обновляем предпросмотр
         if self.auto_preview:
@@ -684,7 +823,7 @@ class RedShapeEditor(QMainWindow):
         self.image_processor.add_region(region)
 
         # Добавляем в историю
-        self.history_manager.add_state(self.image_processor.regions, self.image_processor.mask_regions)
+        self.history_manager.record_add('regions', region)
 
         # Обновляем предпросмотр
         if self.auto_preview:
@@ -695,11 +834,9 @@ class RedShapeEditor(QMainWindow):
         if len(self.current_points) < 3:
             return
 
-        # Конвертируем координаты canvas в координаты изображения
-        img_points = []
-        for x, y in self.current_points:
-            img_x, img_y = self.canvas_to_image_coords(x, y)
-            img_points.append([img_x, img_y])
+        # Конвертируем координаты canvas в координаты изображения и упрощаем контур
+        img_points = simplify_points(self.canvas_to_image_points(self.current_points),
+                                     self.document_processor.stroke_tolerance)
 
         region = {
             'type': 'lasso',
@@ -709,7 +846,7 @@ class RedShapeEditor(QMainWindow):
         self.image_processor.add_region(region)
 
         # Добавляем в историю
-        self.history_manager.add_state(self.image_processor.regions, self.image_processor.mask_regions)
+        self.history_manager.record_add('regions', region)
 
         # Обновляем предпросмотр
         if self.auto_preview:
@@ -720,11 +857,9 @@ class RedShapeEditor(QMainWindow):
         if len(self.current_points) < 3:
             return
 
-        # Конвертируем координаты canvas в координаты изображения
-        img_points = []
-        for x, y in self.current_points:
-            img_x, img_y = self.canvas_to_image_coords(x, y)
-            img_points.append([img_x, img_y])
+        # Конвертируем координаты canvas в координаты изображения и упрощаем контур
+        img_points = simplify_points(self.canvas_to_image_points(self.current_points),
+                                     self.document_processor.stroke_tolerance)
 
         mask_region = {
             'type': 'mask',
@@ -735,7 +870,7 @@ class RedShapeEditor(QMainWindow):
         self.image_processor.add_mask_region(mask_region)
 
         # Добавляем в историю
-        self.history_manager.add_state(self.image_processor.regions, self.image_processor.mask_regions)
+        self.history_manager.record_add('mask_regions', mask_region)
 
         # Обновляем предпросмотр
         if self.auto_preview:
@@ -757,6 +892,18 @@ class RedShapeEditor(QMainWindow):
 
         return img_x, img_y
 
+    def canvas_to_image_points(self, points) -> np.ndarray:
+        """Конвертация массива точек canvas в координаты изображения (как canvas_to_image_coords)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.current_pixmap is None or self.image_processor.current_image is None:
+            return points.astype(np.int32)
+
+        img_h, img_w = self.image_processor.current_image.shape[:2]
+        pixmap_size = np.array([self.current_pixmap.width(), self.current_pixmap.height()])
+        img_points = np.trunc(points * [img_w, img_h] / pixmap_size).astype(np.int32)
+        np.clip(img_points, 0, [img_w - 1, img_h - 1], out=img_points)
+        return img_points
+
     def redraw_all_shapes(self):
         """Перерисовка всех фигур"""
         if self.current_pixmap is None:
@@ -767,123 +914,60 @@ class RedShapeEditor(QMainWindow):
             self.display_auto_preview(self.preview_image)
             return
 
-        # Иначе показываем оригинал с контурами
-        pixmap = self.current_pixmap.copy()
-        painter = QPainter(pixmap)
+        # Иначе показываем оригинал, а контуры - слоем поверх него
+        canvas = self.ui.image_label
+        canvas.setPixmap(self.current_pixmap)
 
-        # Рисуем регионы с БОЛЕЕ ЯРКИМИ И ТОЛСТЫМИ ЛИНИЯМИ
-        painter.setPen(QPen(QColor(255, 255, 0), 3))
-
-        # Временная функция для обратного преобразования координат
-        def image_to_canvas_coords(img_x, img_y):
-            if self.current_pixmap is None or self.image_processor.current_image is None:
-                return img_x, img_y
+        # Масштаб из координат изображения в координаты pixmap
+        img_h, img_w = self.image_processor.current_image.shape[:2]
+        scale = np.array([self.current_pixmap.width() / img_w, self.current_pixmap.height() / img_h])
 
-            pixmap_w = self.current_pixmap.width()
-            pixmap_h = self.current_pixmap.height()
-            img_w = self.image_processor.current_image.shape[1]
-            img_h = self.image_processor.current_image.shape[0]
-
-            canvas_x = int(img_x * pixmap_w / img_w)
-            canvas_y = int(img_y * pixmap_h / img_h)
-            return canvas_x, canvas_y
+        def to_polygon(points):
+            canvas_points = (np.asarray(points, dtype=np.float64).reshape(-1, 2) * scale).astype(np.int32)
+            return QPolygon([QPoint(x, y) for x, y in canvas_points.tolist()])
 
+        # Рисуем регионы с БОЛЕЕ ЯРКИМИ И ТОЛСТЫМИ ЛИНИЯМИ
+        region_pen = QPen(QColor(255, 255, 0), 3)
+        shapes = []
         for region in self.image_processor.regions:
-            if region['type'] == 'rectangle':
-                # Конвертируем координаты обратно для отображения
-                x1, y1 = image_to_canvas_coords(region['x1'], region['y1'])
-                x2, y2 = image_to_canvas_coords(region['x2'], region['y2'])
-
-                # Ограничиваем отрисовку размерами pixmap
-                draw_x1 = max(0, min(x1, x2))
-                draw_y1 = max(0, min(y1, y2))
-                draw_x2 = min(pixmap.width(), max(x1, x2))
-                draw_y2 = min(pixmap.height(), max(y1, y2))
-                painter.drawRect(int(draw_x1), int(draw_y1), int(draw_x2 - draw_x1), int(draw_y2 - draw_y1))
-
-            elif region['type'] == 'ellipse':
-                # Конвертируем координаты обратно для отображения
-                x1, y1 = image_to_canvas_coords(region['x1'], region['y1'])
-                x2, y2 = image_to_canvas_coords(region['x2'], region['y2'])
-
-                # Ограничиваем отрисовку размерами pixmap
-                draw_x1 = max(0, min(x1, x2))
-                draw_y1 = max(0, min(y1, y2))
-                draw_x2 = min(pixmap.width(), max(x1, x2))
-                draw_y2 = min(pixmap.height(), max(y1, y2))
-                painter.drawEllipse(int(draw_x1), int(draw_y1), int(draw_x2 - draw_x1), int(draw_y2 - draw_y1))
-
-            elif region['type'] == 'lasso':
-                points = []
-                for point in region['points']:
-                    canvas_x, canvas_y = image_to_canvas_coords(point[0], point[1])
-                    points.append((canvas_x, canvas_y))
-
-                for i in range(len(points) - 1):
-                    x1, y1 = points[i]
-                    x2, y2 = points[i + 1]
-                    # Ограничиваем линии размерами pixmap
-                    if (0 <= x1 < pixmap.width() and 0 <= y1 < pixmap.height() and
-                            0 <= x2 < pixmap.width() and 0 <= y2 < pixmap.height()):
-                        painter.drawLine(int(x1), int(y1), int(x2), int(y2))
-
-                # Замыкаем контур
-                if len(points) > 1:
-                    x1, y1 = points[-1]
-                    x2, y2 = points[0]
-                    if (0 <= x1 < pixmap.width() and 0 <= y1 < pixmap.height() and
-                            0 <= x2 < pixmap.width() and 0 <= y2 < pixmap.height()):
-                        painter.drawLine(int(x1), int(y1), int(x2), int(y2))
+            if region['type'] in ('rectangle', 'ellipse'):
+                x1, y1, x2, y2 = (np.array([region['x1'], region['y1'], region['x2'], region['y2']])
+                                  * np.tile(scale, 2)).astype(int).tolist()
+                kind = 'rect' if region['type'] == 'rectangle' else 'ellipse'
+                shapes.append((kind, canvas.clamped_rect(x1, y1, x2, y2), region_pen))
+            elif region['type'] == 'lasso' and len(region['points']) > 1:
+                shapes.append(('polygon', to_polygon(region['points']), region_pen))
 
         # Рисуем маски с БОЛЕЕ ЯРКИМИ ЦВЕТАМИ
+        draw_pen = QPen(QColor(255, 100, 100), 4)
+        erase_pen = QPen(QColor(200, 255, 200), 4)
         for mask in self.image_processor.mask_regions:
-            color = QColor(255, 100, 100) if mask['tool'] == 'draw' else QColor(200, 255, 200)
-            painter.setPen(QPen(color, 4))
-
-            points = []
-            for point in mask['points']:
-                canvas_x, canvas_y = image_to_canvas_coords(point[0], point[1])
-                points.append((canvas_x, canvas_y))
-
-            for i in range(len(points) - 1):
-                x1, y1 = points[i]
-                x2, y2 = points[i + 1]
-                # Ограничиваем линии размерами pixmap
-                if (0 <= x1 < pixmap.width() and 0 <= y1 < pixmap.height() and
-                        0 <= x2 < pixmap.width() and 0 <= y2 < pixmap.height()):
-                    painter.drawLine(int(x1), int(y1), int(x2), int(y2))
-
-        painter.end()
-
-        # Масштабируем с УВЕЛИЧЕННЫМ РАЗМЕРОМ
-        scaled_pixmap = pixmap.scaled(
-            self.ui.image_label.width() - 20,
-            self.ui.image_label.height() - 20,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
-        self.ui.image_label.setPixmap(scaled_pixmap)
+            if len(mask['points']) > 1:
+                pen = draw_pen if mask['tool'] == 'draw' else erase_pen
+                shapes.append(('polyline', to_polygon(mask['points']), pen))
+
+        canvas.set_shapes(shapes)
 
     def undo(self):
         """Отмена последнего действия"""
-        state = self.history_manager.undo()
-        if state:
-            self.image_processor.regions = state['regions']
-            self.image_processor.mask_regions = state['mask_regions']
+        operation = self.history_manager.undo()
+        if operation:
+            # Обратное действие пересчитывает маску только в области региона
+            self.image_processor.apply_operation(operation)
 
             # Обновляем отображение
             if self.image_processor.get_region_count() > 0:
                 self.create_auto_preview()
             else:
+                self.preview_worker.cancel()
                 self.display_image()
                 self.update_progress()
 
     def redo(self):
         """Повтор отмененного действия"""
-        state = self.history_manager.redo()
-        if state:
-            self.image_processor.regions = state['regions']
-            self.image_processor.mask_regions = state['mask_regions']
+        operation = self.history_manager.redo()
+        if operation:
+            self.image_processor.apply_operation(operation)
 
             # Обновляем отображение
             if self.image_processor.get_region_count() > 0:
@@ -892,34 +976,23 @@ class RedShapeEditor(QMainWindow):
     def process_current(self):
         """Обработка текущего изображения"""
         try:
-            # Если в режиме предпросмотра, используем уже обработанное изображение
-            if self.preview_mode and self.preview_image is not None:
-                processed_img = self.preview_image
-                replaced_count = self.count_changed_pixels()
-            else:
-                # Иначе обрабатываем заново
-                processed_img, replaced_count = self.image_processor.process_image_with_regions()
+            # Результат строится заново по текущим регионам: предпросмотр из фона
+            # может еще не учитывать последнюю фигуру
+            self.preview_worker.cancel()
+            processed_img, replaced_count = self.image_processor.process_image_with_regions()
 
-            # Сохраняем результат с номером по порядку в документе
             image_idx = self.document_processor.filtered_indices[self.current_index]
-            proc_path = os.path.join(self.document_processor.comparison_dir,
-                                     f"processed_{self.current_index + 1:03d}_docpos_{image_idx + 1:03d}.png")
 
             if replaced_count > 0:
-                cv2.imwrite(proc_path, processed_img)
+                # Обновляем изображение в документе (кодирование идет в фоне)
+                if self.document_processor.update_image_in_document(
+                        image_idx, processed_img, self.image_processor.get_change_mask()):
+                    self.document_processor.processed_images[self.current_index] = image_idx
                 print(f"✓ Обработано: {replaced_count} цветных пикселей (изображение {image_idx + 1} в документе)")
             else:
-                # Если цветных пикселей не найдено, копируем оригинал
-                orig_path = self.document_processor.original_paths[-1]
-                import shutil
-                shutil.copy2(orig_path, proc_path)
+                # Если цветных пикселей не найдено, изображение в документе не меняется
                 print(f"○ Цветные пиксели не найдены (изображение {image_idx + 1} в документе)")
 
-            self.document_processor.processed_paths.append(proc_path)
-
-            # Обновляем изображение в документе
-            self.document_processor.update_image_in_document(image_idx, proc_path)
-
             # Сбрасываем режим предпросмотра
             self.preview_mode = False
             self.ui.btn_preview.setText("👁 Предпросмотр")
@@ -934,22 +1007,12 @@ class RedShapeEditor(QMainWindow):
             QMessageBox.critical(self, "Ошибка", f"Ошибка обработки: {str(e)}")
             print(f"Ошибка обработки: {e}")
 
-    def count_changed_pixels(self):
-        """Подсчет измененных пикселей в предпросмотре"""
-        if self.preview_image is None or self.image_processor.current_image is None:
-            return 0
-
-        # Сравниваем оригинал и предпросмотр
-        diff = cv2.absdiff(self.image_processor.current_image, self.preview_image)
-        gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-
-        # Считаем пиксели, которые действительно изменились
-        changed_pixels = np.sum(gray_diff > 10)  # Порог для учета изменений
-
-        return changed_pixels
-
     def process_or_skip(self):
         """Обработка или пропуск текущего изображения"""
+        if self.image_processor.current_image is None or self.waiting_for_scan:
+            # Изображение еще не найдено сканированием
+            return
+
         if self.image_processor.get_region_count() > 0:
             # Если есть выделения - обрабатываем
             self.process_current()
@@ -959,10 +1022,6 @@ class RedShapeEditor(QMainWindow):
 
     def skip_current(self):
         """Пропустить текущее изображение"""
-        # Добавляем оригинальный путь в processed_paths для пропущенного изображения
-        if len(self.document_processor.processed_paths) <= self.current_index:
-            self.document_processor.processed_paths.append(self.document_processor.original_paths[-1])
-
         self.current_index += 1
         self.load_current_image()
 
@@ -971,12 +1030,10 @@ class RedShapeEditor(QMainWindow):
         if self.current_index > 0:
             # Уменьшаем индекс и загружаем предыдущее изображение
             self.current_index -= 1
+            self.waiting_for_scan = False
 
-            # Удаляем последний элемент из processed_paths и original_paths
-            if self.document_processor.processed_paths:
-                self.document_processor.processed_paths.pop()
-            if self.document_processor.original_paths:
-                self.document_processor.original_paths.pop()
+            # Забываем посещение следующего изображения
+            del self.document_processor.processed_images[self.current_index + 1:]
 
             # Загружаем предыдущее изображение
             self.load_current_image()
@@ -991,50 +1048,29 @@ class RedShapeEditor(QMainWindow):
             if self.image_processor.get_region_count() > 0:
                 print("💾 Сохраняем текущее изображение перед завершением...")
 
-                # Обрабатываем текущее изображение
-                if self.preview_mode and self.preview_image is not None:
-                    processed_img = self.preview_image
-                    replaced_count = self.count_changed_pixels()
-                else:
-                    processed_img, replaced_count = self.image_processor.process_image_with_regions()
+                # Обрабатываем текущее изображение (по текущим регионам, а не по предпросмотру)
+                self.preview_worker.cancel()
+                processed_img, replaced_count = self.image_processor.process_image_with_regions()
 
-                # Сохраняем результат текущего изображения
+                # Обновляем изображение текущего результата в документе
                 image_idx = self.document_processor.filtered_indices[self.current_index]
-                proc_path = os.path.join(self.document_processor.comparison_dir,
-                                         f"processed_{self.current_index + 1:03d}_docpos_{image_idx + 1:03d}.png")
 
                 if replaced_count > 0:
-                    cv2.imwrite(proc_path, processed_img)
+                    if self.document_processor.update_image_in_document(
+                            image_idx, processed_img, self.image_processor.get_change_mask()):
+                        self.document_processor.processed_images[self.current_index] = image_idx
                     print(f"✓ Обработано текущее: {replaced_count} цветных пикселей (изображение {image_idx + 1})")
                 else:
-                    # Если цветных пикселей не найдено, копируем оригинал
-                    orig_path = self.document_processor.original_paths[self.current_index]
-                    import shutil
-                    shutil.copy2(orig_path, proc_path)
                     print(f"○ Цветные пиксели не найдены (изображение {image_idx + 1})")
 
-                # Добавляем или заменяем путь в processed_paths
-                if len(self.document_processor.processed_paths) > self.current_index:
-                    self.document_processor.processed_paths[self.current_index] = proc_path
-                else:
-                    self.document_processor.processed_paths.append(proc_path)
-
-                # Обновляем изображение в документе
-                self.document_processor.update_image_in_document(image_idx, proc_path)
-
-            # Сохраняем документ с новым именем
+            # Сохраняем документ с новым именем (дожидается фонового кодирования)
             output_path = self.document_processor.save_processed_document()
 
-            # Дополнительная проверка: обновляем все обработанные изображения
-            updated_count = 0
-            for i, proc_path in enumerate(self.document_processor.processed_paths):
-                if i < len(self.document_processor.filtered_indices) and os.path.exists(proc_path):
-                    image_idx = self.document_processor.filtered_indices[i]
-                    if self.document_processor.update_image_in_document(image_idx, proc_path):
-                        updated_count += 1
+            processed_images = self.document_processor.processed_images
+            updated_count = sum(1 for image_idx in processed_images if image_idx is not None)
 
             print(f"📄 Документ сохранен как: {output_path}")
-            print(f"🖼 Обновлено изображений: {updated_count}/{len(self.document_processor.processed_paths)}")
+            print(f"🖼 Обновлено изображений: {updated_count}/{len(processed_images)}")
 
             # Показываем результаты
             self.show_results(output_path, updated_count)
@@ -1044,49 +1080,15 @@ class RedShapeEditor(QMainWindow):
             print(f"❌ Ошибка сохранения: {e}")
 
     def show_results(self, output_path, updated_count):
-        """Показать результаты"""
-        # Создаем папку сравнения
-        output_folder = "comparison_results"
-        os.makedirs(output_folder, exist_ok=True)
-
-        comparison_count = 0
-        changed_images = []
-
-        for i, (orig_path, proc_path) in enumerate(zip(self.document_processor.original_paths,
-                                                       self.document_processor.processed_paths)):
-            if os.path.exists(orig_path) and os.path.exists(proc_path):
-                orig_img = cv2.imread(orig_path)
-                proc_img = cv2.imread(proc_path)
-
-                if orig_img is not None and proc_img is not None:
-                    # Проверяем, что изображения действительно разные
-                    if not np.array_equal(orig_img, proc_img):
-                        # Приводим изображения к одинаковому размеру перед объединением
-                        height = max(orig_img.shape[0], proc_img.shape[0])
-                        width = max(orig_img.shape[1], proc_img.shape[1])
-
-                        # Создаем изображения одинакового размера
-                        orig_resized = cv2.resize(orig_img, (width, height))
-                        proc_resized = cv2.resize(proc_img, (width, height))
-
-                        # Объединяем горизонтально
-                        try:
-                            comparison = np.hstack([orig_resized, proc_resized])
-                            image_idx = self.document_processor.filtered_indices[i]
-                            comp_path = os.path.join(output_folder, f"comparison_{image_idx + 1:03d}.png")
-                            cv2.imwrite(comp_path, comparison)
-                            comparison_count += 1
-                            changed_images.append(image_idx + 1)
-                        except Exception as e:
-                            print(f"Ошибка при создании сравнения для изображения {i}: {e}")
-
-        # Показываем изображения без целевых цветов
-        self.show_images_without_target_colors()
+        """Показать результаты; сравнения и проверочные изображения пишутся в фоне"""
+        changed, untouched = self.document_processor.get_report_jobs()
+        changed_images = [image_idx + 1 for image_idx, _, _ in changed]
+        self.start_report(changed, untouched)
 
         # Формируем информационное сообщение
         changed_text = ""
         if changed_images:
-            changed_text = f"\nИзмененные изображения (номера в документе): {sorted(changed_images)}"
+            changed_text = f"\nИзмененные изображения (номера в документе): {changed_images}"
 
         QMessageBox.information(
             self,
@@ -1094,36 +1096,48 @@ class RedShapeEditor(QMainWindow):
             f"📊 Статистика обработки:\n\n"
             f"• Всего изображений в документе: {len(self.document_processor.image_parts)}\n"
             f"• Изображений с целевыми цветами: {len(self.document_processor.filtered_indices)}\n"
-            f"• Обработано изображений: {len(self.document_processor.processed_paths)}\n"
-            f"• Фактически изменено: {comparison_count}\n"
+            f"• Обработано изображений: {len(self.document_processor.processed_images)}\n"
+            f"• Фактически изменено: {len(changed_images)}\n"
             f"• Обновлено в документе: {updated_count}\n\n"
             f"💾 Сохраненный документ:\n{output_path}\n"
-            f"📁 Папка сравнения: {output_folder}"
+            f"📁 Папка сравнения: {COMPARISON_FOLDER} (заполняется в фоне)"
             f"{changed_text}"
         )
 
-    def show_images_without_target_colors(self):
-        """Показать изображения без целевых цветов"""
-        no_color_indices = [i for i in range(len(self.document_processor.image_parts))
-                            if i not in self.document_processor.filtered_indices]
-
-        if no_color_indices:
-            check_folder = "check_no_color_images"
-            os.makedirs(check_folder, exist_ok=True)
-
-            for i, idx in enumerate(no_color_indices):
-                image_part = self.document_processor.image_parts[idx]
-                image_bytes = image_part.blob
-                image_array = np.frombuffer(image_bytes, np.uint8)
-                img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-
-                if img is not None:
-                    cv2.imwrite(os.path.join(check_folder, f"no_color_{i + 1:03d}.png"), img)
-
-            print(f"Сохранено {len(no_color_indices)} изображений без целевых цветов в '{check_folder}'")
+    def start_report(self, changed, untouched):
+        """Запуск фоновой записи отчета"""
+        self.stop_report()
+
+        thumbnail_size = THUMBNAIL_SIZE if self.ui.report_thumbnails_check.isChecked() else None
+        self.report_worker = ReportWorker(self.document_processor.docx_path, changed, untouched,
+                                          thumbnail_size, self)
+        self.report_worker.report_ready.connect(self.on_report_ready)
+        self.report_worker.report_failed.connect(self.on_report_failed)
+        self.report_worker.start()
+
+    def stop_report(self):
+        """Остановка записи отчета (при закрытии окна)"""
+        if self.report_worker is not None:
+            self.report_worker.cancel()
+            self.report_worker.wait()
+            self.report_worker = None
+
+    def on_report_ready(self, summary):
+        for error in summary['errors']:
+            print(error)
+        print(f"Сохранено сравнений: {len(summary['comparisons'])} в '{COMPARISON_FOLDER}'")
+        if summary['untouched']:
+            print(f"Сохранено {summary['untouched']} изображений без целевых цветов в '{NO_COLOR_FOLDER}'")
+
+    def on_report_failed(self, message):
+        print(f"Ошибка записи отчета: {message}")
 
     def closeEvent(self, event):
         """Обработка закрытия окна"""
-        # Очистка временных файлов
+        # Останавливаем сканирование и очищаем временные файлы
+        self.stop_scan()
+        self.stop_report()
+        self.prefetcher.shutdown()
+        self.preview_worker.stop()
         self.document_processor.cleanup()
         event.accept()
\ No newline at end of file
@@ -1,8 +1,115 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QGroupBox, QRadioButton, QButtonGroup,
-                             QProgressBar, QListWidget, QListWidgetItem)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
+                             QProgressBar, QListWidget, QListWidgetItem, QCheckBox)
+from PyQt5.QtCore import Qt, QRect, QPoint
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygon
+
+# Перо временной (рисуемой сейчас) фигуры
+TEMP_SHAPE_PEN = QPen(QColor(255, 255, 0), 2)
+
+
+class ImageCanvas(QLabel):
+    """Метка изображения с векторным слоем поверх него.
+
+    Изображение (setPixmap) - базовый слой: Qt хранит его и при перерисовке
+    копирует только нужный участок. Контуры регионов и временная фигура
+    рисуются в paintEvent поверх базового слоя, поэтому движение мыши
+    перерисовывает лишь прямоугольник, где фигура изменилась, а не все
+    изображение. Координаты фигур - в системе координат pixmap.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.shapes = []  # (вид, геометрия, перо): 'rect', 'ellipse', 'polygon', 'polyline'
+        self.temp_shape = None  # (вид, геометрия)
+
+    def setPixmap(self, pixmap):
+        """Новый базовый слой (контуры прежнего изображения сбрасываются)"""
+        self.shapes = []
+        super().setPixmap(pixmap)
+
+    def pixmap_offset(self) -> QPoint:
+        """Положение pixmap внутри метки (изображение выровнено по центру)"""
+        pixmap = self.pixmap()
+        if pixmap is None:
+            return QPoint(0, 0)
+        return QPoint((self.width() - pixmap.width()) // 2, (self.height() - pixmap.height()) // 2)
+
+    def clamped_rect(self, x1, y1, x2, y2) -> QRect:
+        """Прямоугольник по двум углам, ограниченный размерами pixmap"""
+        pixmap = self.pixmap()
+        left, top = max(0, min(x1, x2)), max(0, min(y1, y2))
+        right, bottom = min(pixmap.width(), max(x1, x2)), min(pixmap.height(), max(y1, y2))
+        return QRect(int(left), int(top), int(right - left), int(bottom - top))
+
+    def set_shapes(self, shapes):
+        """Контуры регионов и масок поверх изображения"""
+        self.shapes = shapes
+        self.update()
+
+    def set_temp_shape(self, kind, geometry):
+        """Замена временной фигуры: перерисовываются старый и новый ее участки"""
+        dirty = self._temp_bounds()
+        self.temp_shape = (kind, geometry)
+        self._update_pixmap_rect(dirty.united(self._temp_bounds()))
+
+    def add_temp_point(self, x, y):
+        """Продолжение временной ломаной: перерисовывается только новый отрезок"""
+        if self.temp_shape is None or self.temp_shape[0] != 'polyline':
+            self.temp_shape = ('polyline', QPolygon())
+        polygon = self.temp_shape[1]
+        point = QPoint(int(x), int(y))
+        last = polygon.last() if polygon.size() else point
+        polygon.append(point)
+        self._update_pixmap_rect(QRect(last, point).normalized())
+
+    def clear_temp_shape(self):
+        dirty = self._temp_bounds()
+        self.temp_shape = None
+        self._update_pixmap_rect(dirty)
+
+    def _temp_bounds(self) -> QRect:
+        if self.temp_shape is None:
+            return QRect()
+        kind, geometry = self.temp_shape
+        return geometry.boundingRect() if kind == 'polyline' else geometry
+
+    def _update_pixmap_rect(self, rect: QRect):
+        """Перерисовка участка метки по прямоугольнику в координатах pixmap (с запасом на перо)"""
+        if rect.isNull():
+            return
+        margin = TEMP_SHAPE_PEN.width() + 1
+        self.update(rect.translated(self.pixmap_offset()).adjusted(-margin, -margin, margin, margin))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        pixmap = self.pixmap()
+        if pixmap is None or pixmap.isNull() or not (self.shapes or self.temp_shape):
+            return
+
+        painter = QPainter(self)
+        painter.translate(self.pixmap_offset())
+        painter.setClipRect(0, 0, pixmap.width(), pixmap.height())
+
+        for kind, geometry, pen in self.shapes:
+            painter.setPen(pen)
+            self._draw(painter, kind, geometry)
+
+        if self.temp_shape is not None:
+            painter.setPen(TEMP_SHAPE_PEN)
+            self._draw(painter, *self.temp_shape)
+        painter.end()
+
+    @staticmethod
+    def _draw(painter, kind, geometry):
+        if kind == 'rect':
+            painter.drawRect(geometry)
+        elif kind == 'ellipse':
+            painter.drawEllipse(geometry)
+        elif kind == 'polygon':
+            painter.drawPolygon(geometry)
+        else:
+            painter.drawPolyline(geometry)
 
 
 class RedShapeEditorUI(QWidget):
@@ -148,6 +255,15 @@ class RedShapeEditorUI(QWidget):
 
         layout.addWidget(preview_group)
 
+        # Отчет после сохранения
+        report_group = QGroupBox("Отчет")
+        report_layout = QVBoxLayout(report_group)
+
+        self.report_thumbnails_check = QCheckBox("Только миниатюры сравнений")
+        report_layout.addWidget(self.report_thumbnails_check)
+
+        layout.addWidget(report_group)
+
         # Инструкция
         instruction_group = QGroupBox("Инструкция")
         instruction_layout = QVBoxLayout(instruction_group)
@@ -183,7 +299,7 @@ class RedShapeEditorUI(QWidget):
         layout = QVBoxLayout(panel)
 
         # Метка для изображения
-        self.image_label = QLabel()
+        self.image_label = ImageCanvas()
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setMinimumSize(800, 600)
         self.image_label.setStyleSheet("border: 1px solid gray; background-color: white;")
@@ -0,0 +1,269 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from core.report_writer import write_report
+from core.display_pyramid import DisplayPyramid
+from core.image_processor import ImageProcessor
+from core.region_mask import RegionMask
+
+# Пауза без новых запросов, после которой предпросмотр уточняется в полном разрешении (с)
+PREVIEW_REFINE_DELAY = 0.15
+
+
+class ScanWorker(QThread):
+    """Фоновое сканирование изображений документа на целевые цвета"""
+
+    # (индекс изображения, есть ли целевые цвета, просканировано, всего)
+    image_scanned = pyqtSignal(int, bool, int, int)
+    scan_failed = pyqtSignal(str)
+
+    def __init__(self, document_processor, color_detector, parent=None):
+        super().__init__(parent)
+        self.document_processor = document_processor
+        self.color_detector = color_detector
+        self._cancelled = False
+
+    def cancel(self):
+        """Запрос остановки сканирования"""
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        total = len(self.document_processor.image_parts)
+        scanned = 0
+        try:
+            for image_idx, has_target_color in self.document_processor.iter_scan_results(
+                    self.color_detector, cancelled=self.is_cancelled):
+                scanned += 1
+                self.image_scanned.emit(image_idx, has_target_color, scanned, total)
+        except Exception as e:
+            self.scan_failed.emit(str(e))
+
+
+class AutoPreviewWorker(QThread):
+    """Фоновый расчет автопредпросмотра.
+
+    Хранится только последний запрос: каждый запрос получает номер
+    поколения, и результаты устаревших поколений не отправляются. Сначала
+    считается грубый предпросмотр в разрешении показа (если он передан),
+    затем, если новых запросов нет PREVIEW_REFINE_DELAY, - полный. Для
+    полного разрешения у потока своя составная маска, которая обновляется
+    инкрементально по снимкам списков регионов.
+    """
+
+    # (поколение, предпросмотр, число замененных пикселей, полное разрешение)
+    preview_ready = pyqtSignal(int, object, int, bool)
+    preview_failed = pyqtSignal(int, str)
+
+    def __init__(self, document_processor, parent=None):
+        super().__init__(parent)
+        self.image_processor = ImageProcessor(document_processor)
+        self.display_processor = ImageProcessor(document_processor)
+        self.generation = 0
+        self._request = None
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def request(self, image, regions, mask_regions, display_image=None) -> int:
+        """Новый запрос предпросмотра (предыдущие устаревают); возвращает его поколение"""
+        with self._condition:
+            self.generation += 1
+            self._request = (self.generation, image, list(regions), list(mask_regions), display_image)
+            self._condition.notify_all()
+        if not self.isRunning():
+            self.start()
+        return self.generation
+
+    def cancel(self):
+        """Отмена ожидающего и текущего запросов"""
+        with self._condition:
+            self.generation += 1
+            self._request = None
+            self._condition.notify_all()
+
+    def stop(self):
+        """Завершение потока (после текущего этапа расчета)"""
+        with self._condition:
+            self._stopped = True
+        self.cancel()
+        self.wait()
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._request is not None or self._stopped)
+                if self._stopped:
+                    return
+                request, self._request = self._request, None
+
+            try:
+                self._process(*request)
+            except Exception as e:
+                self.preview_failed.emit(request[0], str(e))
+
+    def _process(self, generation, image, regions, mask_regions, display_image):
+        if display_image is not None:
+            # Грубый предпросмотр: регионы в масштабе уменьшенной копии
+            scale_x = display_image.shape[1] / image.shape[1]
+            scale_y = display_image.shape[0] / image.shape[0]
+            self.display_processor.regions = [RegionMask.scale(region, scale_x, scale_y) for region in regions]
+            self.display_processor.mask_regions = [RegionMask.scale(mask_region, scale_x, scale_y)
+                                                   for mask_region in mask_regions]
+            preview, replaced_count = self.display_processor.process_image_tiled(display_image.copy())
+            if not self.is_current(generation):
+                return
+            # Число пикселей - оценка для полного разрешения
+            self.preview_ready.emit(generation, preview, int(replaced_count / (scale_x * scale_y)), False)
+
+            with self._condition:
+                if self._condition.wait_for(lambda: not self.is_current(generation) or self._stopped,
+                                            timeout=PREVIEW_REFINE_DELAY):
+                    return
+
+        if self.image_processor.current_image is not image:
+            # Новое изображение - составная маска строится заново
+            self.image_processor.current_image = image
+            self.image_processor.regions = []
+            self.image_processor.mask_regions = []
+        self.image_processor.set_regions(regions, mask_regions)
+        preview, replaced_count = self.image_processor.process_image_with_regions()
+        if self.is_current(generation):
+            self.preview_ready.emit(generation, preview, int(replaced_count), True)
+
+
+class ReportWorker(QThread):
+    """Фоновая запись отчета (сравнения и изображения без целевых цветов)"""
+
+    report_ready = pyqtSignal(dict)
+    report_failed = pyqtSignal(str)
+
+    def __init__(self, docx_path, changed, untouched, thumbnail_size=None, parent=None):
+        super().__init__(parent)
+        self.docx_path = docx_path
+        self.changed = changed
+        self.untouched = untouched
+        self.thumbnail_size = thumbnail_size
+        self._cancelled = False
+
+    def cancel(self):
+        """Запрос остановки записи отчета"""
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        try:
+            summary = write_report(self.docx_path, self.changed, self.untouched,
+                                   thumbnail_size=self.thumbnail_size,
+                                   cancelled=self.is_cancelled)
+            self.report_ready.emit(summary)
+        except Exception as e:
+            self.report_failed.emit(str(e))
+
+
+class PrefetchedImage:
+    """Изображение, заранее подготовленное к показу"""
+
+    def __init__(self, index, image_idx, color_pixels, display_image, display_size, original_path,
+                 display_pyramid=None):
+        self.index = index
+        self.image_idx = image_idx
+        self.color_pixels = color_pixels
+        self.display_image = display_image
+        self.display_pyramid = display_pyramid
+        self.display_size = display_size
+        self.original_path = original_path
+
+
+class ImagePrefetcher:
+    """Фоновая подготовка соседних изображений очереди редактирования.
+
+    Для следующих изображений (и предыдущего - для возврата назад) заранее
+    выполняются декодирование (результат остается в кэше документа), подсчет
+    целевых пикселей и подготовка уменьшенного QImage для показа.
+    """
+
+    def __init__(self, document_processor, image_processor, ahead: int = 3, workers: int = 2):
+        self.document_processor = document_processor
+        self.image_processor = image_processor
+        self.ahead = ahead
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs = {}  # image_idx -> Future
+
+    def schedule(self, current_index: int, display_size: Tuple[int, int]):
+        """Запуск подготовки изображений вокруг текущего"""
+        filtered_indices = self.document_processor.filtered_indices
+        wanted = {}
+
+        for index in range(current_index + 1, min(current_index + 1 + self.ahead, len(filtered_indices))):
+            wanted[filtered_indices[index]] = (index, True)
+        if 0 < current_index <= len(filtered_indices):
+            # Предыдущее изображение уже сохранено как оригинал - только готовим показ
+            wanted[filtered_indices[current_index - 1]] = (current_index - 1, False)
+
+        for image_idx in list(self._jobs):
+            if image_idx not in wanted:
+                self._jobs.pop(image_idx).cancel()
+
+        for image_idx, (index, save_original) in wanted.items():
+            if image_idx not in self._jobs:
+                self._jobs[image_idx] = self.executor.submit(
+                    self._prepare, index, image_idx, display_size, save_original)
+
+    def take(self, image_idx: int, display_size: Tuple[int, int]) -> Optional[PrefetchedImage]:
+        """Результат подготовки (ожидает завершения, если она уже идет)"""
+        future = self._jobs.pop(image_idx, None)
+        if future is None or future.cancelled():
+            return None
+
+        try:
+            prefetched = future.result()
+        except Exception as e:
+            print(f"Ошибка предзагрузки изображения {image_idx + 1}: {e}")
+            return None
+
+        if prefetched is not None and prefetched.display_size != display_size:
+            # Размер области показа изменился - уменьшенная копия не подходит
+            prefetched.display_image = None
+        return prefetched
+
+    def clear(self):
+        """Отмена всех подготовленных и запланированных изображений"""
+        for future in self._jobs.values():
+            future.cancel()
+        self._jobs.clear()
+
+    def shutdown(self):
+        self.clear()
+        self.executor.shutdown(wait=True)
+
+    def _prepare(self, index, image_idx, display_size, save_original) -> Optional[PrefetchedImage]:
+        """Подготовка одного изображения (выполняется в фоновом потоке)"""
+        img = self.document_processor.get_image(image_idx)
+        if img is None:
+            return None
+
+        color_pixels = sum(self.document_processor.count_target_pixels(image_idx, self.image_processor))
+
+        # Уменьшенные копии для показа; пирамида передается окну для перерисовок
+        display_pyramid = DisplayPyramid(img)
+        rendered = display_pyramid.render(display_size)
+        h, w = rendered.shape[:2]
+        display_image = QImage(rendered.data, w, h, rendered.strides[0], QImage.Format_BGR888).copy()
+
+        original_path = None
+        if save_original:
+            original_path = self.document_processor.save_original_image(index, image_idx)
+
+        return PrefetchedImage(index, image_idx, color_pixels, display_image, display_size, original_path,
+                               display_pyramid)